@@ -1,8 +1,8 @@
 # manager_agent.py
 # This agent will manage the agents and their interactions with each other decide whether it needs to write, review or human_review needed
-from google import genai
 from google.genai.types import GenerateContentConfig
-from utils.config import Config, WorkflowState
+from llm_gateway import get_llm_gateway
+from utils.config import Config, WorkflowState, chapter_text
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 
@@ -13,16 +13,31 @@ class ManagerAgent:
             temperature=self.config.TEMPERATURE, 
             max_output_tokens=self.config.GEMINI_OUTPUT_TOKEN_LIMIT
             )
-        self.client = genai.Client(
-            project=self.config.PROJECT_ID,
-            location=self.config.LOCATION,
-            vertexai=True
-        )
+        # shared process wide client, pooled connections and per model concurrency limits
+        self.llm = get_llm_gateway()
 
     def manager_workflow(self, state: WorkflowState)->WorkflowState:
         """Content Manager Agent - Makes workflow decisions based on current state of workflow"""
+        manager_decision = self.llm.generate_content(
+            model = self.config.MODEL_NAME,
+            contents=[self._prompt(state)],
+            config = self.generation_config,
+            agent="manager"
+        )
+        return self._decide(state, manager_decision)
+
+    async def amanager_workflow(self, state: WorkflowState)->WorkflowState:
+        """Async manager_workflow, awaits the model without holding a thread"""
+        manager_decision = await self.llm.agenerate_content(
+            model = self.config.MODEL_NAME,
+            contents=[self._prompt(state)],
+            config = self.generation_config,
+            agent="manager"
+        )
+        return self._decide(state, manager_decision)
 
-        manager_prompt = f"""
+    def _prompt(self, state: WorkflowState) -> str:
+        return f"""
         You are a content management specialist responsible for managing the workflow for AI book publication. Your task is to make decisions about how to proceed in the workflow.
         Based on the reviewer feedback and content quality, decide what is the next step in the workflow.
 
@@ -36,7 +51,7 @@ class ManagerAgent:
         Respond with ONLY the decision keyword from above options without any additional text.
 
         Current Content:
-        {state['current_content']} 
+        {chapter_text(state['current_content'])} 
 
         Reviewer Feedback:
         {state['reviewer_feedback']}
@@ -46,13 +61,8 @@ class ManagerAgent:
 
         What should be the next step?"""
 
-        # as we are using async then need to use await keyword before client call
-        manager_decision = self.client.models.generate_content(
-            model = self.config.MODEL_NAME,
-            contents=[manager_prompt],
-            config = self.generation_config
-        )        
-
+    def _decide(self, state: WorkflowState, manager_decision) -> WorkflowState:
+        """Map the model's answer to a routing decision"""
         print(f"Manager Decision: {manager_decision.candidates[0].content.parts[0].text.strip().lower()}")
         print(f"Manager Iteration Count: {state['iteration_count']}")
         # Clean up the decision (remove extra text)
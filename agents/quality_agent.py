@@ -1,9 +1,10 @@
 # AI Book Publication
 # This agent will be used to check final quality of the book before publishing
-from google import genai
-from utils.config import Config, WorkflowState 
+from llm_gateway import get_llm_gateway
+from utils.config import Config, WorkflowState, chapter_text
 from google.genai.types import GenerateContentConfig
 from langchain_core.messages import AIMessage, HumanMessage
+from llm_streaming import acollect_stream, collect_stream, with_timings
 
 
 class QualityAgent:
@@ -13,11 +14,8 @@ class QualityAgent:
             temperature=self.config.TEMPERATURE,
             max_output_tokens=self.config.GEMINI_OUTPUT_TOKEN_LIMIT
         )
-        self.client = genai.Client(
-            project=self.config.PROJECT_ID,
-            location=self.config.LOCATION,
-            vertexai=True
-        )
+        # shared process wide client, pooled connections and per model concurrency limits
+        self.llm = get_llm_gateway()
 
     def check_quality(self, state: WorkflowState)-> WorkflowState:
         """
@@ -27,7 +25,35 @@ class QualityAgent:
         print(f"====> Checking Quality of the book...")
 
         try:
-            prompt = f"""
+            quality_report, timings = collect_stream(self.llm.stream_content(
+                model=self.config.MODEL_NAME,
+                contents=[self._prompt(state)],
+                config=self.generation_config,
+                agent="quality"
+            ), "quality")
+            return self._result(state, quality_report, timings)
+        except Exception as e:
+            return self._error(state, e)
+
+    async def acheck_quality(self, state: WorkflowState) -> WorkflowState:
+        """
+        Async check_quality, awaits the model without holding a thread.
+        """
+        print(f"====> Checking Quality of the book...")
+
+        try:
+            quality_report, timings = await acollect_stream(self.llm.astream_content(
+                model=self.config.MODEL_NAME,
+                contents=[self._prompt(state)],
+                config=self.generation_config,
+                agent="quality"
+            ), "quality")
+            return self._result(state, quality_report, timings)
+        except Exception as e:
+            return self._error(state, e)
+
+    def _prompt(self, state: WorkflowState) -> str:
+        return f"""
             You are a Literature Quality Expert, perform a final quality check on this book. 
             Check for:
             
@@ -37,32 +63,27 @@ class QualityAgent:
             4. Content completeness
             
             Final Content:
-            {state['current_content']}
+            {chapter_text(state['current_content'])}
 
             Provide a final quality score (1-10) and brief summary as quality report.
             
             """
-            # as we are using async then need to use await keyword before client call
-            quality_report = self.client.models.generate_content(
-                model=self.config.MODEL_NAME,
-                contents=[prompt],
-                config=self.generation_config
 
-            )
+    def _result(self, state: WorkflowState, quality_report: str, timings: dict) -> WorkflowState:
+        return {
+            **state,
+            "quality_report": quality_report,
+            "metadata": with_timings(state, "quality", timings),
+            "messages": state.get("messages",[])+[AIMessage(content="Quality Check Completed!")],
+            "status": "completed",
+        }
 
-            return {
-                **state,
-                "quality_report": quality_report.text,
-                "messages": state.get("messages",[])+[AIMessage(content="Quality Check Completed!")],
-                "status": "completed",
-            }
-        
-        except Exception as e:
-            return {
-                **state,
-                "messages": state.get("messages",[])+[AIMessage(content=f"Quality Check error - {e}!")],
-                "status": "quality_error",
-            }
+    def _error(self, state: WorkflowState, e: Exception) -> WorkflowState:
+        return {
+            **state,
+            "messages": state.get("messages",[])+[AIMessage(content=f"Quality Check error - {e}!")],
+            "status": "quality_error",
+        }
 
 
 # #### FOR TESTING PURPOSES ONLY ####
@@ -1,9 +1,10 @@
 # AI Book Publication Workflow
 # This agent will be used to review the book and provide feedback on it.
-from google import genai
-from utils.config import Config, WorkflowState 
+from llm_gateway import get_llm_gateway
+from utils.config import Config, WorkflowState, chapter_text
 from google.genai.types import GenerateContentConfig
 from langchain_core.messages import AIMessage, HumanMessage
+from llm_streaming import acollect_stream, collect_stream, with_timings
 
 
 class ReviewerAgent:
@@ -13,22 +14,44 @@ class ReviewerAgent:
             temperature=0.2,
             max_output_tokens=self.config.GEMINI_OUTPUT_TOKEN_LIMIT,
         )
-        self.client = genai.Client(
-            vertexai=True,
-            project=self.config.PROJECT_ID,
-            location=self.config.LOCATION,
-        )
+        # shared process wide client, pooled connections and per model concurrency limits
+        self.llm = get_llm_gateway()
 
     def review_content(self, state: WorkflowState) -> WorkflowState:
         """Review the spun content against the original content and provide feedback."""
-        prompt = f"""
+        try:
+            reviewer_feedback, timings = collect_stream(self.llm.stream_content(
+                model = self.config.MODEL_NAME,
+                contents = [self._prompt(state)],
+                config = self.generation_config,
+                agent="reviewer",
+            ), "reviewer")
+            return self._result(state, reviewer_feedback, timings)
+        except Exception as e:
+            return self._error(state, e)
+
+    async def areview_content(self, state: WorkflowState) -> WorkflowState:
+        """Async review_content, awaits the model without holding a thread"""
+        try:
+            reviewer_feedback, timings = await acollect_stream(self.llm.astream_content(
+                model = self.config.MODEL_NAME,
+                contents = [self._prompt(state)],
+                config = self.generation_config,
+                agent="reviewer",
+            ), "reviewer")
+            return self._result(state, reviewer_feedback, timings)
+        except Exception as e:
+            return self._error(state, e)
+
+    def _prompt(self, state: WorkflowState) -> str:
+        return f"""
         You are a literary reviewer. Compare original content with rewritten content and provide feedback.
 
         Original Content:
-        {state['original_content']}...
+        {chapter_text(state['original_content'])}...
 
         Rewritten Content:
-        {state['current_content']}...
+        {chapter_text(state['current_content'])}...
 
         Please provide:
         1. Overall quality score: (1-10)
@@ -40,27 +63,22 @@ class ReviewerAgent:
         Review:
         """
 
-        try:
-            # as we are using async then need to use await keyword before client call
-            reviewer_feedback = self.client.models.generate_content(
-                model = self.config.MODEL_NAME,
-                contents = [prompt],
-                config = self.generation_config,
-            )
-
-            return {
-                **state,
-                "reviewer_feedback": reviewer_feedback.text,
-                "iteration_count": state.get("iteration_count", 1) + 1,
-                "messages": state.get("messages", []) + [AIMessage(content=f"Reviewer: Feedback recieved by the Reviewer!")],
-                "status": "reviewer_completed",
-            }
-        except Exception as e:
-            print(f"Error in generating review: {e}")
-            return {**state,
-                    "messages": state.get("messages", []) + [HumanMessage(content=f"Reviewer: Error occured during reviewing!")],
-                    "status": "reviewer_error",
-            }
+    def _result(self, state: WorkflowState, reviewer_feedback: str, timings: dict) -> WorkflowState:
+        return {
+            **state,
+            "reviewer_feedback": reviewer_feedback,
+            "metadata": with_timings(state, "reviewer", timings),
+            "iteration_count": state.get("iteration_count", 1) + 1,
+            "messages": state.get("messages", []) + [AIMessage(content=f"Reviewer: Feedback recieved by the Reviewer!")],
+            "status": "reviewer_completed",
+        }
+
+    def _error(self, state: WorkflowState, e: Exception) -> WorkflowState:
+        print(f"Error in generating review: {e}")
+        return {**state,
+                "messages": state.get("messages", []) + [HumanMessage(content=f"Reviewer: Error occured during reviewing!")],
+                "status": "reviewer_error",
+        }
         
 
 
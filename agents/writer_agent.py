@@ -2,10 +2,10 @@
 We are defining Writer Agent here
 """
 from google.genai.types import GenerateContentConfig,SafetySetting
-import os, tempfile, re, uuid
+import os, tempfile, re, uuid, asyncio
 from google.cloud import aiplatform
-from google import genai
-from utils.config import Config, WorkflowState
+from llm_gateway import get_llm_gateway
+from utils.config import Config, WorkflowState, chapter_text
 from typing import Dict 
 from langchain_google_vertexai import (
     VertexAI,
@@ -14,7 +14,10 @@ from langchain_google_vertexai import (
     VectorSearchVectorStore
 )
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from chroma_manager import ChromaManager
+from chroma_manager import get_chroma_manager
+from version_index import chapter_ref
+from llm_streaming import StreamTimer, acollect_stream, collect_stream, with_timings
+from chunked_rewrite import rewrite_segments, split_segments, stitch
 
 
 
@@ -25,14 +28,11 @@ class WriterAgent:
             temperature = 0,
             max_output_tokens = self.config.GEMINI_OUTPUT_TOKEN_LIMIT
         )
-        self.client = genai.Client(
-            vertexai=True,
-            project=self.config.PROJECT_ID,
-            location=self.config.LOCATION,
-        )
+        # shared process wide client, pooled connections and per model concurrency limits
+        self.llm = get_llm_gateway()
 
         # chromadb
-        self.chroma_manager = ChromaManager()
+        self.chroma_manager = get_chroma_manager()
         # self.model = VertexAI(
         #     temperature = 0,
         #     model_name = self.config.MODEL_NAME,
@@ -48,6 +48,134 @@ class WriterAgent:
         """ 
 
         print("Spinning content...")
+        try:
+            if self._chunked(state):
+                return self._store_output(state, *asyncio.run(self._arewrite_chunked(state)))
+            # streamed, the partial rewrite reaches the ui while the model is still writing
+            writer_output, timings = collect_stream(self.llm.stream_content(
+                model = self.config.MODEL_NAME,
+                contents= [self._prompt(state)],
+                config = self.generation_config,
+                agent="writer"
+            ), "writer")
+            return self._store_output(state, writer_output, timings)
+        except Exception as e:
+            return self._error(state, e)
+
+    async def aspin_content(self, state: WorkflowState) -> WorkflowState:
+        """
+        Async spin_content, awaits the model without holding a thread
+        """
+        print("Spinning content...")
+        try:
+            segments = None
+            if self._chunked(state):
+                writer_output, timings, segments = await self._arewrite_chunked(state)
+            else:
+                writer_output, timings = await acollect_stream(self.llm.astream_content(
+                    model = self.config.MODEL_NAME,
+                    contents= [self._prompt(state)],
+                    config = self.generation_config,
+                    agent="writer"
+                ), "writer")
+            # the chroma store can wait on the snapshot restore, embed and push inline, keep it off the event loop
+            return await asyncio.to_thread(self._store_output, state, writer_output, timings, segments)
+        except Exception as e:
+            return self._error(state, e)
+
+    def _rewrite_source(self, state: WorkflowState) -> str:
+        """Text a chunked rewrite splits, the original chapter text on every iteration"""
+        return chapter_text(state['original_content'])
+
+    @staticmethod
+    def _previous_segments(state: WorkflowState, count: int):
+        """
+        Rewrites of the segments from the previous iteration, the current content of each segment on a
+        revision. None when there is none or the writer output no longer is their stitch (edited since).
+        """
+        previous = (state.get('metadata') or {}).get('writer_segments')
+        if not previous or len(previous) != count or stitch(previous) != state.get('writer_output'):
+            return None
+        return previous
+
+    def _chunked(self, state: WorkflowState) -> bool:
+        return self.config.WRITER_CHUNKED and len(self._rewrite_source(state)) > self.config.WRITER_CHUNK_CHARS
+
+    async def _arewrite_chunked(self, state: WorkflowState):
+        """
+        (rewrite, timings, segment rewrites) of a long chapter, the original text split into segments that are
+        rewritten concurrently and stitched in order; on revisions each segment also gets its previous rewrite.
+        The stitched text streams out as the leading segments complete.
+        """
+        segments = split_segments(
+            self._rewrite_source(state), self.config.WRITER_CHUNK_CHARS, self.config.WRITER_CHUNK_CONTEXT_PARAGRAPHS
+        )
+        previous = self._previous_segments(state, len(segments))
+        print(f"Rewriting {len(segments)} segments...")
+        timer = StreamTimer("writer")
+        done, stats = {}, {}
+
+        def on_segment(index: int, text: str):
+            done[index] = text
+            # only the in order prefix is streamed, later segments wait for the ones before them
+            while len(timer.parts) in done:
+                timer.add(("\n\n" if timer.parts else "") + done[len(timer.parts)].strip())
+
+        async def rewrite(segment):
+            response = await self.llm.agenerate_content(
+                model = self.config.MODEL_NAME,
+                contents= [self._segment_prompt(state, segment, previous[segment['index']] if previous else None)],
+                config = self.generation_config,
+                agent="writer"
+            )
+            return response.text
+
+        rewrites = await rewrite_segments(
+            segments, rewrite,
+            concurrency=self.config.WRITER_CHUNK_CONCURRENCY,
+            retries=self.config.WRITER_CHUNK_RETRIES,
+            on_segment=on_segment,
+            stats=stats,
+        )
+        _, timings = timer.finish()
+        timings = {**timings, "segments": len(segments), "segment_retries": stats["retries"]}
+        return stitch(rewrites), timings, rewrites
+
+    def _segment_prompt(self, state: WorkflowState, segment, current=None) -> str:
+        return f"""
+        You are a creative writer rewriting one segment ({segment['index'] + 1} of {segment['count']}) of a chapter while maintaining the same tone and style.
+
+        Please provide a rewritten version of the segment that:
+        1. Maintains the original meaning and key plot points intact.
+        2. Uses fresh language and varied sentence structures
+        3. Enhances narrative flow, pacing, readability and engagement for readers.
+        4. Improves descriptive language and character voices
+        5. Preserves the overall mood and atmosphere and the approximate length of the segment.
+
+        Only rewrite the segment. The context before and after it (from the original) is there for continuity, do not rewrite or repeat it.
+        If this is a revision (iteration>1), consider the previous reviewer feedback for the segment.
+
+        Previous Feedback:
+        {state['reviewer_feedback']}
+
+        Iteration: {state['iteration_count']}
+
+        Context before:
+        {segment['before']}
+
+        Original Segment:
+        {segment['text']}
+
+        Current Segment:
+        {current or segment['text']}
+
+        Context after:
+        {segment['after']}
+
+        Rewritten segment:
+        """
+
+    def _prompt(self, state: WorkflowState) -> str:
         # print("Original Content:", state['original_content'])
         # print("Current Content:", state['current_content'])
         # print("Reviewer Feedback: ", state['reviewer_feedback'])
@@ -68,10 +196,10 @@ class WriterAgent:
         If this is a revision (iteration>1), consider the previous reviewer feedback carefully and rewrite the content accordingly but keep the core meaning intact.
 
         Original Content:
-        {state['original_content']}
+        {chapter_text(state['original_content'])}
 
         Current Content:
-        {state['current_content']}
+        {chapter_text(state['current_content'])}
 
         Previous Feedback:
         {state['reviewer_feedback']}
@@ -80,42 +208,51 @@ class WriterAgent:
 
         Rewritten content:
         """
+        return prompt
 
-        try:
-            writer_output = self.client.models.generate_content(
-                model = self.config.MODEL_NAME,
-                contents= [prompt],
-                config = self.generation_config
-            )
+    def _store_output(self, state: WorkflowState, writer_output: str, timings: Dict, segments=None) -> WorkflowState:
+        # store content to chromadb
+        # the scraped record carries the chapter url, it identifies the chapter across versions
+        source = state['original_content'] if isinstance(state['original_content'], dict) else {}
+        source_url = source.get('url') or self.config.DEFAULT_URL
+        metadata = {
+            **chapter_ref(source_url),
+            "type": "writer_output",
+            "version": f"v{state['iteration_count']}",
+            "status": "writer_completed",
+            "source_url": source_url,
+            "chapter": source.get('title') or "Chapter 1",
+            "iteration": state.get("iteration_count", 1)
+        }
 
-            # store content to chromadb
-            metadata = {
-                "type": "writer_output",
-                "version": f"v{state['iteration_count']}",
-                "status": "writer_completed",
-                "source_url": "https://www.google.com",
-                "chapter": "Chapter 1",
-                "iteration": state.get("iteration_count", 1)
-            }
+        # call Chromamanager to store the content with versioning
+        # (quick, the chroma write itself happens in the write-behind queue)
+        self.chroma_manager.store_content(writer_output, metadata)
+        print(f"Storing content to chroma: {metadata}")
 
-            # call Chromamanager to store the content with versioning
-            self.chroma_manager.store_content(writer_output.text, metadata)
-            print(f"Storing content to chroma: {metadata}")
+        state_metadata = with_timings(state, "writer", timings)
+        # a chunked rewrite keeps its segments, the next revision gives each one its previous rewrite
+        if segments is not None:
+            state_metadata["writer_segments"] = segments
+        else:
+            state_metadata.pop("writer_segments", None)
 
-            return {
-                **state,
-                'current_content': writer_output.text,
-                'writer_output': writer_output.text,
-                'messsages' : AIMessage(content=f"Writer: Content enhanced and rewritten"),
-                "status": "writer_completed"
+        return {
+            **state,
+            'current_content': writer_output,
+            'writer_output': writer_output,
+            'metadata': state_metadata,
+            'messsages' : AIMessage(content=f"Writer: Content enhanced and rewritten"),
+            "status": "writer_completed"
+        }
+
+    def _error(self, state: WorkflowState, e: Exception) -> WorkflowState:
+        print(f"An error occurred: {e}")
+        return {
+            **state,
+            'messages': AIMessage(content=f"Writer: Error occurred during spinning content"),
+            'status': 'writer_error',       
             }
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return {
-                **state,
-                'messages': AIMessage(content=f"Writer: Error occurred during spinning content"),
-                'status': 'writer_error',       
-                }
 
 
 #### FOR TESTING PURPOSES ONLY ####
@@ -0,0 +1,84 @@
+# bench_extraction.py
+# micro-benchmark of the html extraction stage over the stored content/*.json fixtures
+# usage: python bench_extraction.py [--repeat 50]
+import argparse
+import glob
+import html
+import json
+import re
+import statistics
+import time
+from bs4 import BeautifulSoup
+from extraction import PARSER, extract_paragraphs
+
+
+def page_html(record: dict) -> str:
+    """Rebuild a wikisource like page around a stored record: page chrome, header box, footnotes and paragraphs"""
+    paragraphs = "".join(
+        f"<p>{html.escape(line)}<sup class=\"reference\">[{i % 3 + 1}]</sup></p>\n"
+        for i, line in enumerate(record["content"].split("\n")) if line.strip()
+    )
+    chrome = "".join(f'<li><a href="/wiki/Page_{i}">Navigation link {i}</a></li>' for i in range(300))
+    scripts = "".join(f"<script>var config{i} = {{'key': {i}}};</script>" for i in range(50))
+    return f"""<!DOCTYPE html><html><head><title>{html.escape(record["title"])}</title>{scripts}</head><body>
+<div id="mw-navigation"><ul>{chrome}</ul></div>
+<h1 id="firstHeading">{html.escape(record.get("url", "").rsplit("/wiki/", 1)[-1])}</h1>
+<div class="mw-parser-output"><div id="headertemplate">← Previous Layout 2 Next →</div>
+{paragraphs}</div>
+<div id="footer"><ul>{chrome}</ul></div></body></html>"""
+
+
+def legacy_extract(page: str) -> str:
+    """The previous stage: whole page through html.parser, then five regex passes"""
+    soup = BeautifulSoup(page, 'html.parser')
+    main_content = soup.find('div', {'class': 'mw-parser-output'})
+    text = main_content.get_text(separator='\n', strip=True)
+    text = re.sub(r"[←→]", "", text)
+    text = re.sub(r"Layout\s*\d+", "", text)
+    text = re.sub(r"\[\d+\]", "", text)
+    text = re.sub(r"\s{2,}", " ", text).strip()
+    return re.sub(r"\[\s*\d+\s*\]", "", text)
+
+
+def targeted_extract(page: str) -> str:
+    title, paragraphs = extract_paragraphs(page)
+    return "\n\n".join(paragraphs)
+
+
+def timed(fn, pages, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        samples.append((time.perf_counter() - start) / len(pages) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the html extraction stage")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--fixtures", default="content/chapter_*.json")
+    args = parser.parse_args()
+
+    records = []
+    for path in sorted(glob.glob(args.fixtures)):
+        with open(path, 'r', encoding='utf-8') as file:
+            records.append(json.load(file))
+    if not records:
+        raise SystemExit(f"No fixtures match {args.fixtures}")
+    pages = [page_html(record) for record in records]
+
+    print(f"{len(pages)} fixtures, avg page {sum(map(len, pages)) // len(pages)} chars, parser {PARSER}, {args.repeat} runs")
+    results = {}
+    for name, fn in (("legacy", legacy_extract), ("targeted", targeted_extract)):
+        median, best = timed(fn, pages, args.repeat)
+        results[name] = median
+        output = fn(pages[0])
+        print(f"{name:>9}: median {median:.2f}ms  best {best:.2f}ms per page, "
+              f"{len(output.split(chr(10) * 2))} paragraphs, {len(output)} chars")
+    print(f"speedup: {results['legacy'] / results['targeted']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# bench_gcs_sync.py
+# compares the old full re-upload of the chroma directory with the incremental sync and times snapshot restore,
+# against a local bucket stand-in
+# usage: python bench_gcs_sync.py [--versions 5]
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+import chromadb
+from gcs_sync import LocalBucket, SnapshotSync
+
+
+def full_upload(bucket: LocalBucket, local_dir: str) -> dict:
+    """The previous behaviour: every file of the directory uploaded after each write"""
+    start, files, size = time.perf_counter(), 0, 0
+    for root, dirs, names in os.walk(local_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            bucket.blob(f"full/{os.path.relpath(path, local_dir)}").upload_from_filename(path)
+            files += 1
+            size += os.path.getsize(path)
+    return {"uploaded": files, "bytes_uploaded": size, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the incremental chroma GCS sync")
+    parser.add_argument("--source", default="chroma_db", help="chroma directory to start from")
+    parser.add_argument("--versions", type=int, default=5, help="writer versions to store")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_gcs_sync_")
+    try:
+        local_dir = os.path.join(work, "chroma_db")
+        shutil.copytree(args.source, local_dir)
+        bucket = LocalBucket(os.path.join(work, "bucket"))
+        sync = SnapshotSync(bucket, local_dir, prefix="chroma_db/", manifest_path=os.path.join(work, "sync.json"))
+        print(f"initial sync: {sync.push()}")
+
+        collection = chromadb.PersistentClient(path=local_dir).get_or_create_collection("book_content")
+        for version in range(args.versions):
+            # precomputed embeddings, the benchmark measures storage traffic and not the embedding model
+            collection.add(
+                ids=[str(uuid.uuid4())],
+                documents=[f"writer version {version} " * 200],
+                embeddings=[[random.random() for _ in range(384)]],
+                metadatas=[{"type": "writer_output", "iteration": version}],
+            )
+            full = full_upload(bucket, local_dir)
+            incremental = sync.push()
+            print(f"version {version + 1}: full {full['uploaded']} files / {full['bytes_uploaded']} bytes "
+                  f"in {full['seconds']}s, incremental {incremental['uploaded']} files / "
+                  f"{incremental['bytes_uploaded']} bytes in {incremental['seconds']}s")
+
+        # cold start into an empty directory, then a warm start that already holds the generation
+        restored = SnapshotSync(bucket, os.path.join(work, "restored"), prefix="chroma_db/")
+        os.makedirs(restored.local_dir)
+        print(f"cold restore: {restored.restore()}")
+        print(f"warm restore: {restored.restore()}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# bench_passages.py
+# compares whole document search with passage search (vector only and hybrid vector + FTS5 keyword)
+# over the stored chapters: recall of the right document, hit of the right passage, and query latency
+# usage: python bench_passages.py [--queries 50] [--k 5] [--offline]
+import argparse
+import hashlib
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import time
+import chromadb
+from passages import KeywordIndex, rrf_fuse, split_passages
+from utils.config import Config
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]")
+
+
+class HashingEmbedding:
+    """Hashed bag of words vectors, for running the benchmark without downloading the embedding model"""
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def __call__(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions] += 1.0
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+
+def sample_queries(docs, count: int, seed: int = 7):
+    """(query, doc_id, character offset) from random sentences of at least eight words"""
+    rng = random.Random(seed)
+    sentences = [
+        (match.group().strip(), doc_id, match.start())
+        for doc_id, text in docs.items()
+        for match in SENTENCE_PATTERN.finditer(text)
+        if len(match.group().split()) >= 8
+    ]
+    return rng.sample(sentences, min(count, len(sentences)))
+
+
+def timed(search, queries):
+    latencies, hits = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits.append(search(query[0]))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return hits, latencies
+
+
+def summary(name, queries, hits, latencies, passage_level: bool):
+    doc_recall = sum(query[1] in [hit[0] for hit in found] for query, found in zip(queries, hits)) / len(queries)
+    line = f"{name:<22} doc recall {doc_recall:.2f}"
+    if passage_level:
+        passage_hit = sum(
+            any(hit[0] == query[1] and hit[1] <= query[2] < hit[2] for hit in found)
+            for query, found in zip(queries, hits)
+        ) / len(queries)
+        line += f"  passage hit {passage_hit:.2f}"
+    else:
+        line += "  passage hit    -"
+    ordered = sorted(latencies)
+    print(f"{line}  latency mean {statistics.mean(latencies):.2f}ms p95 {ordered[int(len(ordered) * 0.95) - 1]:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark passage level hybrid search against whole documents")
+    parser.add_argument("--source", default="chroma_db", help="chroma directory holding the stored chapters")
+    parser.add_argument("--queries", type=int, default=50, help="sampled sentences to search for")
+    parser.add_argument("--k", type=int, default=5, help="results per query")
+    parser.add_argument("--offline", action="store_true", help="hashed bag of words instead of the embedding model")
+    args = parser.parse_args()
+    config = Config()
+
+    work = tempfile.mkdtemp(prefix="bench_passages_")
+    try:
+        # a copy, opening the client writes to the directory
+        source = os.path.join(work, "source")
+        shutil.copytree(args.source, source)
+        stored = chromadb.PersistentClient(path=source).get_or_create_collection("book_content")
+        results = stored.get(include=["documents"])
+        docs = dict(zip(results["ids"], results["documents"]))
+        if not docs:
+            print(f"No stored documents in {args.source}")
+            return
+
+        if args.offline:
+            embed = HashingEmbedding()
+        else:
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            embed = DefaultEmbeddingFunction()
+
+        client = chromadb.PersistentClient(path=os.path.join(work, "bench"))
+        whole = client.create_collection("whole")
+        start = time.perf_counter()
+        whole.add(ids=list(docs), documents=list(docs.values()), embeddings=embed(list(docs.values())))
+        whole_seconds = time.perf_counter() - start
+
+        passages = client.create_collection("passages")
+        keywords = KeywordIndex(os.path.join(work, "keywords.sqlite3"))
+        spans = {}
+        start = time.perf_counter()
+        for doc_id, text in docs.items():
+            windows = split_passages(text, config.CHROMA_PASSAGE_CHARS, config.CHROMA_PASSAGE_OVERLAP)
+            ids = [f"{doc_id}:{number}" for number in range(len(windows))]
+            texts = [window for offset, window in windows]
+            passages.add(ids=ids, documents=texts, embeddings=embed(texts))
+            keywords.add(ids, [doc_id] * len(ids), texts)
+            for passage_id, (offset, window) in zip(ids, windows):
+                spans[passage_id] = (doc_id, offset, offset + len(window))
+        passage_seconds = time.perf_counter() - start
+        print(f"{len(docs)} documents indexed in {whole_seconds:.2f}s, "
+              f"{len(spans)} passages indexed in {passage_seconds:.2f}s")
+
+        queries = sample_queries(docs, args.queries)
+        candidates = args.k * config.CHROMA_HYBRID_CANDIDATES
+
+        def search_whole(query):
+            found = whole.query(query_embeddings=embed([query]), n_results=min(args.k, len(docs)))
+            return [(doc_id, 0, len(docs[doc_id])) for doc_id in found["ids"][0]]
+
+        def vector_passages(query, n_results):
+            return passages.query(query_embeddings=embed([query]), n_results=min(n_results, len(spans)))["ids"][0]
+
+        def search_vector(query):
+            return [spans[passage_id] for passage_id in vector_passages(query, args.k)]
+
+        def search_hybrid(query):
+            keyword_ids = [passage_id for passage_id, score in keywords.search(query, candidates)]
+            fused = rrf_fuse([vector_passages(query, candidates), keyword_ids])[:args.k]
+            return [spans[passage_id] for passage_id, score in fused]
+
+        print(f"{len(queries)} sampled sentence queries, top {args.k}")
+        summary("whole documents", queries, *timed(search_whole, queries), passage_level=False)
+        summary("passages (vector)", queries, *timed(search_vector, queries), passage_level=True)
+        summary("passages (hybrid)", queries, *timed(search_hybrid, queries), passage_level=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,15 @@ import json
 from langgraph.graph import StateGraph, START, END
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from datetime import datetime 
 import operator
+from typing import Any, AsyncIterator, Dict
 from utils.config import Config, WorkflowState 
 from scraper import ContentScraper
 from agents.writer_agent import WriterAgent
 from agents.reviewer_agent import ReviewerAgent
-from chroma_manager import ChromaManager
+from chroma_manager import get_chroma_manager
 from agents.manager_agent import ManagerAgent
 from agents.quality_agent import QualityAgent
 #from langgraph.checkpoint.sqlite import SqliteSaver
@@ -36,7 +38,7 @@ class BookPublicationWorkflow:
         self.scraper = ContentScraper()
         self.writer = WriterAgent()
         self.reviewer = ReviewerAgent()
-        self.chroma = ChromaManager()
+        self.chroma = get_chroma_manager()
         self.manager = ManagerAgent()
         self.quality = QualityAgent()
         # build the workflow graph
@@ -60,11 +62,13 @@ class BookPublicationWorkflow:
         workflow = StateGraph(WorkflowState)
 
         # add nodes
+        # the agent nodes carry a sync and an async version: app.invoke runs the first,
+        # app.ainvoke / app.astream await the second on the event loop instead of a worker thread
         #workflow.add_node("scrape", self._scrape_node)
-        workflow.add_node("writer_agent", self.writer.spin_content)
-        workflow.add_node("reviewer_agent", self.reviewer.review_content)
-        workflow.add_node("manager_agent", self.manager.manager_workflow)
-        workflow.add_node("quality_check", self.quality.check_quality)
+        workflow.add_node("writer_agent", RunnableLambda(self.writer.spin_content, afunc=self.writer.aspin_content))
+        workflow.add_node("reviewer_agent", RunnableLambda(self.reviewer.review_content, afunc=self.reviewer.areview_content))
+        workflow.add_node("manager_agent", RunnableLambda(self.manager.manager_workflow, afunc=self.manager.amanager_workflow))
+        workflow.add_node("quality_check", RunnableLambda(self.quality.check_quality, afunc=self.quality.acheck_quality))
         workflow.add_node("human_review", self.human_feedback_node)
         #workflow.add_node("finalize", self._finalize_node)
 
@@ -112,6 +116,23 @@ class BookPublicationWorkflow:
         return workflow
     
 
+    @staticmethod
+    def thread_config(thread_id: str) -> Dict:
+        return {"configurable": {"thread_id": thread_id}}
+
+    async def ainvoke(self, state: Any, thread_id: str) -> Dict:
+        """
+        Run a workflow thread on the async agent nodes, until it ends or interrupts for human review.
+        state is the initial WorkflowState, or a Command(resume=...) to resume an interrupted thread.
+        Many threads can be awaited together (asyncio.gather) from one event loop.
+        """
+        return await self.app.ainvoke(state, config=self.thread_config(thread_id))
+
+    async def astream(self, state: Any, thread_id: str, stream_mode: str = "updates") -> AsyncIterator:
+        """ainvoke, yielding each node's update (or stream_mode chunk) as it completes"""
+        async for chunk in self.app.astream(state, config=self.thread_config(thread_id), stream_mode=stream_mode):
+            yield chunk
+
     def manager_decision_router(self, state: WorkflowState)->str:
         """Route manager decision to appropriate node"""
         
@@ -0,0 +1,200 @@
+# browser_pool.py
+# long lived headless chromium + browser context pool shared by all the scrapes of the process
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+# it is used to drive the headless chromium browser
+from playwright.async_api import Page, async_playwright
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _ContextSlot:
+    """One pooled browser context and how many pages it has served"""
+    def __init__(self, context):
+        self.context = context
+        self.pages_served = 0
+        self.healthy = True
+
+
+class BrowserPool:
+    """
+    Keeps a single chromium browser and a fixed number of browser contexts alive
+    across scrapes. Playwright objects are bound to the event loop that created them,
+    and streamlit runs every scrape inside a fresh asyncio.run(), so the pool owns a
+    dedicated event loop thread and scrapes are submitted to it.
+    """
+    def __init__(self, size: Optional[int] = None, max_pages_per_context: Optional[int] = None):
+        self.config = Config()
+        self.size = size or self.config.BROWSER_POOL_SIZE
+        self.max_pages_per_context = max_pages_per_context or self.config.BROWSER_POOL_MAX_PAGES_PER_CONTEXT
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+        # below objects live on the pool loop only
+        self._playwright = None
+        self._browser = None
+        self._slots: Optional[asyncio.Queue] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+
+        self.stats = {
+            "cold_launch_seconds": None,   # launch + first context + first page, measured on first use
+            "browser_launches": 0,
+            "pooled_scrapes": 0,
+            "acquire_seconds_total": 0.0,  # time spent getting a ready page out of the pool
+            "recycled_contexts": 0,
+        }
+
+    # ---- event loop thread ----
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._thread_lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="browser-pool", daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coro: Awaitable[T]):
+        """Schedule a coroutine on the pool loop, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def submit_with_page(self, fn: Callable[[Page], Awaitable[T]]):
+        """Schedule fn(page) on a pooled page without waiting, returns a concurrent.futures.Future"""
+        return self.submit(self._run_with_page(fn))
+
+    async def run(self, fn: Callable[[Page], Awaitable[T]]) -> T:
+        """Run fn(page) on a pooled page, callable from any event loop"""
+        return await asyncio.wrap_future(self.submit_with_page(fn))
+
+    # ---- browser lifecycle (pool loop only) ----
+    async def _ensure_browser(self):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+
+        async with self._launch_lock:
+            # health check: relaunch if chromium crashed or was closed
+            if self._browser is not None and self._browser.is_connected():
+                return
+
+            if self._browser is not None:
+                logger.warning("Pooled chromium is disconnected, relaunching")
+                await self._shutdown_browser()
+
+            start = time.perf_counter()
+            self._playwright = await async_playwright().start()
+            # launch the browser with now browser window
+            # as we dont want to open browser window in case of dockerized cloudrun deployed run
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._slots = asyncio.Queue()
+            for _ in range(self.size):
+                self._slots.put_nowait(_ContextSlot(await self._browser.new_context()))
+            self.stats["browser_launches"] += 1
+
+            if self.stats["cold_launch_seconds"] is None:
+                # a throwaway page makes the reference comparable to the old launch-per-scrape path
+                page = await self._browser.new_page()
+                await page.close()
+                self.stats["cold_launch_seconds"] = time.perf_counter() - start
+
+            logger.info(f"Browser pool ready with {self.size} contexts in {time.perf_counter() - start:.2f}s")
+
+    async def _acquire(self) -> _ContextSlot:
+        slot = await self._slots.get()
+        # recycle contexts after N pages so cookies, cache and leaked memory do not pile up
+        if not slot.healthy or slot.pages_served >= self.max_pages_per_context:
+            slot = await self._recycle(slot)
+        return slot
+
+    async def _recycle(self, slot: _ContextSlot) -> _ContextSlot:
+        try:
+            await slot.context.close()
+        except Exception as e:
+            logger.debug(f"Closing recycled context failed: {e}")
+        self.stats["recycled_contexts"] += 1
+        return _ContextSlot(await self._browser.new_context())
+
+    async def _run_with_page(self, fn: Callable[[Page], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        await self._ensure_browser()
+        slot = await self._acquire()
+        # keep a reference to the queue the slot came from, a relaunch swaps the queue
+        slots = self._slots
+        page = None
+        try:
+            page = await slot.context.new_page()
+            self.stats["acquire_seconds_total"] += time.perf_counter() - start
+            self.stats["pooled_scrapes"] += 1
+            return await fn(page)
+        except Exception:
+            # the context may be broken (crashed renderer, closed target), replace it on next use
+            slot.healthy = False
+            raise
+        finally:
+            slot.pages_served += 1
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    slot.healthy = False
+            slots.put_nowait(slot)
+
+    async def _shutdown_browser(self):
+        try:
+            if self._browser is not None:
+                await self._browser.close()
+        except Exception as e:
+            logger.debug(f"Closing browser failed: {e}")
+        try:
+            if self._playwright is not None:
+                await self._playwright.stop()
+        except Exception as e:
+            logger.debug(f"Stopping playwright failed: {e}")
+        self._browser = None
+        self._playwright = None
+
+    def close(self, timeout: float = 10):
+        """Close chromium and stop the pool loop"""
+        if self._loop is None or not self._thread.is_alive():
+            return
+        try:
+            self.submit(self._shutdown_browser()).result(timeout=timeout)
+        except Exception as e:
+            logger.debug(f"Browser pool shutdown failed: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # ---- reporting ----
+    def report(self) -> Dict:
+        """Average per scrape time saved by the pool compared with a cold browser launch"""
+        scrapes = self.stats["pooled_scrapes"]
+        avg_acquire = self.stats["acquire_seconds_total"] / scrapes if scrapes else None
+        cold = self.stats["cold_launch_seconds"]
+        saved = cold - avg_acquire if cold is not None and avg_acquire is not None else None
+        return {
+            **self.stats,
+            "avg_acquire_seconds": avg_acquire,
+            "saved_seconds_per_scrape": saved,
+        }
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Process wide browser pool used by every ContentScraper"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -1,15 +1,32 @@
 # chroma_manager.py
 # chroma db manager for AI book publication
+import time
+_import_start = time.perf_counter()
 import os, sys
 import json
-import chromadb
-from chromadb.config import Settings
+# chromadb and google.cloud.storage are heavy, they are imported on first real use (see _ensure_ready)
 from datetime import datetime
 from utils.config import Config 
 from typing import List, Dict, Optional
 import uuid
-from google.cloud import storage
-from google.auth.exceptions import DefaultCredentialsError
+import resource
+import threading
+# incremental upload of the chroma directory, only changed files go to the bucket
+from gcs_sync import LocalBucket, SnapshotSync
+# durable local queue + background batched adds, so store_content does not block on chroma and GCS
+from write_behind import WriteBehindQueue
+# vectors cached by content hash and model, identical texts are embedded once
+from embedding_cache import EmbeddingCache, content_hash
+# (chapter_id, version) side table, history queries without loading document bodies
+from version_index import VersionIndex
+# repeat searches (streamlit reruns) are answered from memory until the next write
+from search_cache import QueryVectors, SearchCache
+# paragraph windows with an FTS5 keyword index, fused with vector ranks in search
+from passages import KeywordIndex, rrf_fuse, split_passages
+# chapter versions as line deltas against the previous version, outside chroma
+from delta_store import DeltaStore
+# embeddings computed in worker processes instead of the calling thread
+from embedding_executor import EmbeddingExecutor
 import logging
 # used for temporary file creation
 import tempfile
@@ -18,41 +35,178 @@ logger = logging.getLogger(__name__)
 
 
 class ChromaManager:
-    def __init__(self):
+    """
+    Vector store of the book content versions, backed by a chroma PersistentClient
+    and mirrored to a GCS bucket. Use get_chroma_manager() instead of building one,
+    every instance downloads the GCS snapshot and opens its own client on the directory.
+    Construction is cheap: the GCS connection, snapshot restore and chroma client are
+    set up on first use, or ahead of it by warm_up() in a background thread.
+    """
+    def __init__(self, warm_up: Optional[bool] = None):
+        construct_start = time.perf_counter()
         self.config = Config()
+        # serializes writes and the GCS sync between the streamlit sessions sharing this instance
+        self._lock = threading.RLock()
+        self._init_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.startup = {"import_seconds": IMPORT_SECONDS, "peak_rss_mb_before": _peak_rss_mb(), "ready": False}
+
+        self.storage_client = None
+        self.bucket = None
+        self.sync = None
+        self.chroma_path = None
+        self.client = None
+        self._collection = None
+        self.write_queue = None
+        self.embeddings = None
+        self._passages = None
+        self.keywords = None
+        self.deltas = None
+        self.delta_sync = None
+        self.embedder = None
+        self.reindex_progress: Dict = {}
+        self.versions = None
+        self.duplicates_skipped = 0
+        self.search_cache = SearchCache(self.config.CHROMA_SEARCH_CACHE_SIZE, self.config.CHROMA_SEARCH_CACHE_TTL)
+        self.query_vectors = None
+
+        self.startup["construct_seconds"] = time.perf_counter() - construct_start
+        if self.config.CHROMA_WARMUP if warm_up is None else warm_up:
+            self.warm_up()
+
+    def warm_up(self) -> threading.Thread:
+        """Initialize the clients in a background thread so the first real use does not wait for them"""
+        thread = threading.Thread(target=self._ensure_ready, name="chroma-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def collection(self):
+        self._ensure_ready()
+        return self._collection
+
+    def _ensure_ready(self):
+        if self._ready.is_set():
+            return
+        with self._init_lock:
+            if self._ready.is_set():
+                return
+            self._initialize()
+            self._ready.set()
+
+    def _initialize(self):
+        init_start = time.perf_counter()
+        import chromadb
+        self.startup["chromadb_import_seconds"] = time.perf_counter() - init_start
 
         # initialize the gcloud client for uploading files to GCS bucket
-        try: 
-            self.storage_client = storage.Client(
-                project=self.config.PROJECT_ID,
-            )
-            
-            self.bucket = self.storage_client.get_bucket(self.config.GCS_BUCKET_NAME)
-            logger.info(f"Connected to Google Cloud Storage Bucket {self.bucket.name}")
-        
-        except DefaultCredentialsError as e:
-            logger.warning("GCS credentials not found,  using local storage")
-            self.storage_client = None
-            self.bucket = None
-        
+        if self.config.GCS_LOCAL_BUCKET_PATH:
+            # local directory standing in for the bucket (benchmarks, runs without GCS)
+            self.bucket = LocalBucket(self.config.GCS_LOCAL_BUCKET_PATH)
+            logger.info(f"Using local bucket stand-in at {self.config.GCS_LOCAL_BUCKET_PATH}")
+        else:
+            self.storage_client, self.bucket = self._connect_gcs()
+
         # setup chromaDB path
+        step_start = time.perf_counter()
         self.chroma_path = self._setup_chroma_path()
+        # version bodies stored as deltas live in their own directory, synced like the chroma one
+        delta_root = f"{os.path.normpath(self.chroma_path)}_versions"
+        self.deltas = DeltaStore(delta_root, self.config.CHROMA_DELTA_KEYFRAME_INTERVAL)
+        if self.bucket:
+            self.delta_sync = SnapshotSync(self.bucket, delta_root,
+                                           prefix=f"{self.config.GCS_CHROMA_PREFIX.rstrip('/')}_versions/")
+            try:
+                self.startup["delta_restore"] = self.delta_sync.restore()
+            except Exception as e:
+                logger.error(f"Failed to download the version deltas from GCS: {e}")
+        self.startup["gcs_download_seconds"] = time.perf_counter() - step_start
 
         try:
             # store the books on chromadb database
             self.client = chromadb.PersistentClient(path = self.chroma_path)
+            # the collection's own embedding function, documents are embedded through the persistent cache
+            # and added with precomputed vectors, queries call the function directly and keep their
+            # vectors in a bounded in memory LRU, so typed searches never grow the embeddings sqlite
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            embedding_function = DefaultEmbeddingFunction()
             # create collection
-            self.collection = self.client.get_or_create_collection(
+            self._collection = self.client.get_or_create_collection(
                 name="book_content",
                 metadata={
                     "description": "Book Content with versions"
-                }
+                },
+                embedding_function=embedding_function,
             )
+            if self.config.CHROMA_EMBED_PROCESSES > 0:
+                self.embedder = EmbeddingExecutor(self.config.CHROMA_EMBED_PROCESSES,
+                                                  self.config.CHROMA_EMBED_BATCH_SIZE)
+            self.embeddings = EmbeddingCache(
+                f"{os.path.normpath(self.chroma_path)}.embeddings.sqlite3",
+                model_id=self.config.CHROMA_EMBEDDING_MODEL_ID or embedding_function.name(),
+                embed_fn=self.embedder or embedding_function,
+            )
+            self.query_vectors = QueryVectors(self.config.CHROMA_SEARCH_CACHE_SIZE, embedding_function)
+            if self.config.CHROMA_PASSAGE_INDEX:
+                self._passages = self.client.get_or_create_collection(
+                    name="book_passages",
+                    metadata={
+                        "description": "Paragraph windows of the book content"
+                    },
+                    embedding_function=embedding_function,
+                )
+                self.keywords = KeywordIndex(f"{os.path.normpath(self.chroma_path)}.keywords.sqlite3")
             logger.info(f"CheomaDB initialized at {self.chroma_path}")
 
         except Exception as e:
             logger.error(f"Failed to connect to ChromaDB: {e}")
+
+        self.versions = VersionIndex(f"{os.path.normpath(self.chroma_path)}.versions.sqlite3")
+        if self._collection is not None and self._collection.count():
+            # the index is local, after a restore on a new machine it is rebuilt from the chroma metadata
+            if self.versions.count() == 0:
+                results = self._collection.get(where={"version_number": {"$gt": 0}}, include=["metadatas"])
+                self.versions.rebuild(results["metadatas"])
+            if self.versions.document_count() == 0:
+                self._rebuild_document_index()
+            if self._passages is not None:
+                self._backfill_passages()
+
+        if self.config.CHROMA_WRITE_BEHIND:
+            self.write_queue = WriteBehindQueue(
+                f"{os.path.normpath(self.chroma_path)}.queue.sqlite3",
+                add_batch=self._add_batch,
+                sync=self._upload_chroma_to_gcs if self.bucket else None,
+                on_dead_letter=self._drop_unstored,
+            )
+
+        self.startup["init_seconds"] = time.perf_counter() - init_start
+        self.startup["peak_rss_mb_after"] = _peak_rss_mb()
+        self.startup["ready"] = True
+        logger.info(f"ChromaManager ready in {self.startup['init_seconds']:.2f}s "
+                    f"(GCS download {self.startup['gcs_download_seconds']:.2f}s, "
+                    f"peak RSS {self.startup['peak_rss_mb_after']:.0f}MB)")
+
+    def _connect_gcs(self):
+        """(storage client, bucket), both None when there are no GCS credentials"""
+        from google.cloud import storage
+        from google.auth.exceptions import DefaultCredentialsError
+        try: 
+            storage_client = storage.Client(
+                project=self.config.PROJECT_ID,
+            )
+            
+            bucket = storage_client.get_bucket(self.config.GCS_BUCKET_NAME)
+            logger.info(f"Connected to Google Cloud Storage Bucket {bucket.name}")
+            return storage_client, bucket
         
+        except DefaultCredentialsError as e:
+            logger.warning("GCS credentials not found,  using local storage")
+            return None, None
+
+    def startup_report(self) -> Dict:
+        """Import, construction and first use initialization time, and memory of the shared instance"""
+        return dict(self.startup)
 
     def _setup_chroma_path(self)->str:
         """
@@ -63,42 +217,27 @@ class ChromaManager:
             os.makedirs(local_path, exist_ok=True)
 
             # download existing chromadb data from GCS if exists
-            self._download_chroma_from_gcs(local_path)
+            self.sync = SnapshotSync(self.bucket, local_path)
+            self._download_chroma_from_gcs()
 
             return local_path
         else:
+            self.sync = None
             os.makedirs(self.config.CHROMA_DB_PATH, exist_ok=True)
             return self.config.CHROMA_DB_PATH
     
 
-    def _download_chroma_from_gcs(self, local_path:str):
+    def _download_chroma_from_gcs(self):
         """Download chromaDB from gcs, for chroma we need local path,
         so we upload chroma to local path after operation, and before operation
-        we download gcs data from bucket to local path"""
-        if not self.bucket:
+        we download gcs data from bucket to local path.
+        Blobs are fetched in parallel, and a warm temp dir holding the latest
+        snapshot generation skips the download."""
+        if not self.sync:
             return
         
         try:
-            # check the blobs or folders in the bucket
-            blobs = self.bucket.list_blobs(prefix="chroma_db/")
-
-            for blob in blobs:
-                # create local file path
-                relative_path = blob.name.replace("chroma_db/","")
-                if not relative_path or blob.name.endswith("/"): # skip directory makers and use root
-                    continue 
-
-                local_file_path = os.path.join(local_path, relative_path)
-
-                # create directories if needed
-                os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-
-                # download the file
-                blob.download_to_filename(local_file_path)
-                logger.debug(f"Downloaded {blob.name} to {local_file_path}")
-
-            logger.info("ChromaDB downloaded successfully from GCS")
-
+            self.startup["restore"] = self.sync.restore()
         except Exception as e:
             logger.error(f"Failed to download ChromaDB from GCS: {e}")
 
@@ -106,24 +245,17 @@ class ChromaManager:
     def _upload_chroma_to_gcs(self):
         """Upload chromaDB to gcs, for chroma wye need local path,
         so we upload chroma to local path after operation, and before operation
-        we download gcs data from bucket to local path"""
-        if not self.bucket:
+        we download gcs data from bucket to local path.
+        Only the files changed since the last sync are uploaded."""
+        if not self.sync:
             return
-        
+
         try:
-            # upload all file in chroma directory
-            for root, dirs, files in os.walk(self.chroma_path):
-                for file in files:
-                    local_file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(local_file_path, self.chroma_path)
-                    gcs_path = f"chroma_db/{relative_path}"
-
-                    blob = self.bucket.blob(gcs_path) 
-                    blob.upload_from_filename(local_file_path)
-                    logger.debug(f"Uploaded {local_file_path} to {gcs_path}")
-
-                logger.info("ChromaDB uploaded successfully to GCS")
-        
+            # no chroma write in the middle of the upload
+            with self._lock:
+                self.sync.push()
+                if self.delta_sync:
+                    self.delta_sync.push()
         except Exception as e:
             logger.error(f"Failed to upload ChromaDB to GCS: {e}")
 
@@ -132,6 +264,19 @@ class ChromaManager:
     def store_content(self, content: str, metadata: Dict)-> str:
         """
         Store content with metadata and return document ID"""
+        self._ensure_ready()
+        # metadata chroma would reject fails here, before any index lists the document
+        from chromadb.api.types import validate_metadata
+        validate_metadata(metadata)
+
+        text_hash = content_hash(content)
+        if self.config.CHROMA_SKIP_DUPLICATES:
+            existing = self._find_duplicate(text_hash, metadata)
+            if existing:
+                self.duplicates_skipped += 1
+                metadata.update({"doc_id": existing, "content_hash": text_hash})
+                logger.info(f"Content identical to {existing}, not stored again")
+                return existing
 
         doc_id = str(uuid.uuid4())
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -140,72 +285,440 @@ class ChromaManager:
         metadata.update(
             {
                 "timestamp": timestamp,
-                "doc_id": doc_id
+                "doc_id": doc_id,
+                "content_hash": text_hash
             }
         )
-
-        self.collection.add(
-            documents=[content],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
-
-        if self.bucket:
-            self._upload_chroma_to_gcs()
+        metadata["content_bytes"] = len(content.encode('utf-8'))
+        if metadata.get("chapter_id"):
+            if self.config.CHROMA_DELTA_VERSIONS:
+                # the body goes to the delta store, encoded against the chapter's previous version
+                metadata["storage"] = "delta"
+                previous = self.versions.latest(metadata["chapter_id"])
+                if previous:
+                    metadata["delta_base"] = previous["doc_id"]
+            # numbered per chapter, the number is kept in the chroma metadata as well
+            metadata["version_number"] = self.versions.record(metadata["chapter_id"], metadata)
+        self.versions.add_document(metadata, content, self.config.CHROMA_PREVIEW_CHARS)
+
+        if self.write_queue:
+            # returns at once, the flusher adds it to chroma with other pending writes
+            self.write_queue.enqueue(doc_id, content, metadata)
+            logger.info(f"Content queued with ID: {doc_id}")
+            return doc_id
+
+        with self._lock:
+            self._chroma_add([doc_id], [content], self._embed([content]), [metadata])
+            self._index_passages([doc_id], [content], [metadata])
+            self.search_cache.invalidate()
+
+            if self.bucket:
+                self._upload_chroma_to_gcs()
 
         logger.info(f"Content stored with ID: {doc_id}")
         return doc_id
+
+    def _drop_unstored(self, doc_ids: List[str]):
+        """Queued documents the write-behind queue gave up on leave the version and listing indexes"""
+        self.versions.remove(doc_ids)
+        self.search_cache.invalidate()
+        logger.error(f"Dropped {len(doc_ids)} documents that could not be added to ChromaDB: {doc_ids}")
+
+    def _add_batch(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """One collection.add for a batch of queued writes"""
+        embeddings = self._embed(documents)
+        with self._lock:
+            self._chroma_add(ids, documents, embeddings, metadatas)
+            self._index_passages(ids, documents, metadatas)
+            self.search_cache.invalidate()
+        logger.info(f"Flushed {len(ids)} queued documents to ChromaDB")
+
+    def _chroma_add(self, ids: List[str], documents: List[str], embeddings: Optional[List], metadatas: List[Dict]):
+        """collection.add, bodies of delta stored versions are written to the delta store and left out of chroma"""
+        delta = [metadata.get("storage") == "delta" for metadata in metadatas]
+        for doc_id, document, metadata, is_delta in zip(ids, documents, metadatas, delta):
+            if is_delta:
+                self.deltas.put(doc_id, document, metadata.get("delta_base"))
+        for stored_in_delta in (False, True):
+            picked = [i for i, is_delta in enumerate(delta) if is_delta == stored_in_delta]
+            if not picked:
+                continue
+            self.collection.add(
+                ids=[ids[i] for i in picked],
+                documents=None if stored_in_delta else [documents[i] for i in picked],
+                embeddings=[embeddings[i] for i in picked] if embeddings else None,
+                metadatas=[metadatas[i] for i in picked],
+            )
+
+    def _bodies(self, ids: List[str], documents: List[Optional[str]], metadatas: List[Dict]) -> List[Optional[str]]:
+        """Documents as read from chroma, with the bodies of delta stored versions rebuilt from the delta store"""
+        return [
+            self.deltas.get(doc_id) if document is None and (metadata or {}).get("storage") == "delta" else document
+            for doc_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+
+    def _index_passages(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Split the documents into paragraph windows, add them to the passage collection and the keyword index"""
+        if self._passages is None:
+            return
+        passage_ids, texts, passage_metadatas = [], [], []
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            # the filterable fields of the document, so where filters work on passages too
+            inherited = {key: metadata[key] for key in ("type", "book", "chapter", "chapter_id", "iteration", "version_number")
+                         if metadata.get(key) is not None}
+            for number, (offset, text) in enumerate(split_passages(
+                    document, self.config.CHROMA_PASSAGE_CHARS, self.config.CHROMA_PASSAGE_OVERLAP)):
+                passage_ids.append(f"{doc_id}:{number}")
+                texts.append(text)
+                passage_metadatas.append({**inherited, "doc_id": doc_id, "passage": number, "offset": offset})
+        if not passage_ids:
+            return
+        self._passages.add(ids=passage_ids, documents=texts, embeddings=self._embed(texts), metadatas=passage_metadatas)
+        self.keywords.add(passage_ids, [metadata["doc_id"] for metadata in passage_metadatas], texts)
+
+    def _backfill_passages(self, page_size: int = 100):
+        """Index the passages of documents stored before passage indexing was turned on"""
+        if self._passages.count() == 0:
+            offset = 0
+            while True:
+                results = self._collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+                if not results["ids"]:
+                    break
+                self._index_passages(results["ids"], self._bodies(results["ids"], results["documents"], results["metadatas"]),
+                                     results["metadatas"])
+                offset += page_size
+            logger.info(f"Indexed {self._passages.count()} passages of {self._collection.count()} stored documents")
+        elif self.keywords.count() == 0:
+            # the keyword index is local, rebuild it from the passage collection after a restore
+            offset = 0
+            while True:
+                results = self._passages.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+                if not results["ids"]:
+                    break
+                self.keywords.add(results["ids"], [metadata["doc_id"] for metadata in results["metadatas"]],
+                                  results["documents"])
+                offset += page_size
+
+    def _embed(self, documents: List[str]) -> Optional[List]:
+        """Cached vectors of the documents, None lets chroma embed them itself"""
+        return self.embeddings.embed(documents) if self.embeddings else None
+
+    def _embed_queries(self, queries: List[str]) -> Optional[List]:
+        """Vectors of search queries, from the in memory LRU, None lets chroma embed them itself"""
+        return self.query_vectors.embed(queries) if self.query_vectors else None
+
+    def _find_duplicate(self, text_hash: str, metadata: Dict) -> Optional[str]:
+        """doc_id of a stored or queued document with the same text, type and chapter"""
+        fields = {key: metadata[key] for key in ("type", "chapter_id") if metadata.get(key) is not None}
+        if self.write_queue:
+            queued = self.write_queue.find_pending(text_hash, **fields)
+            if queued:
+                return queued
+        conditions = [{"content_hash": text_hash}] + [{key: value} for key, value in fields.items()]
+        where = {"$and": conditions} if len(conditions) > 1 else conditions[0]
+        results = self.collection.get(where=where, limit=1, include=[])
+        return results["ids"][0] if results["ids"] else None
+
+    def embedding_report(self) -> Dict:
+        """Embedding cache hits, misses and model time, the duplicate versions not stored, and the worker pool throughput"""
+        report = self.embeddings.report() if self.embeddings else {}
+        report = {**report, "duplicates_skipped": self.duplicates_skipped}
+        if self.embedder:
+            report["executor"] = self.embedder.report()
+        return report
+
+    def reindex(self, book: Optional[str] = None, page_size: int = 64, background: bool = True):
+        """
+        Compute the embeddings of every stored document (of one book when given) and their passages
+        again, e.g. after changing the embedding model. Runs in a background thread by default and
+        reports its progress and throughput in reindex_progress.
+        """
+        self._ensure_ready()
+        if self.reindex_progress.get("status") == "running":
+            raise RuntimeError("A re-index is already running")
+        self.reindex_progress = {"status": "running", "book": book, "documents": 0, "passages": 0,
+                                 "seconds": 0.0, "documents_per_second": None}
+        if not background:
+            self._reindex(book, page_size)
+            return None
+        thread = threading.Thread(target=self._reindex, args=(book, page_size), name="chroma-reindex", daemon=True)
+        thread.start()
+        return thread
+
+    def _reindex(self, book: Optional[str], page_size: int):
+        progress = self.reindex_progress
+        start = time.perf_counter()
+        where = {"book": book} if book else None
+        try:
+            offset = 0
+            while True:
+                results = self._collection.get(where=where, limit=page_size, offset=offset,
+                                               include=["documents", "metadatas"])
+                if not results["ids"]:
+                    break
+                documents = self._bodies(results["ids"], results["documents"], results["metadatas"])
+                embeddings = self.embeddings.embed(documents, refresh=True)
+                with self._lock:
+                    self._collection.update(ids=results["ids"], embeddings=embeddings)
+                progress["documents"] += len(results["ids"])
+
+                if self._passages is not None:
+                    passages = self._passages.get(where={"doc_id": {"$in": results["ids"]}}, include=["documents"])
+                    if passages["ids"]:
+                        passage_embeddings = self.embeddings.embed(passages["documents"], refresh=True)
+                        with self._lock:
+                            self._passages.update(ids=passages["ids"], embeddings=passage_embeddings)
+                        progress["passages"] += len(passages["ids"])
+
+                offset += page_size
+                progress["seconds"] = round(time.perf_counter() - start, 3)
+                progress["documents_per_second"] = round(progress["documents"] / progress["seconds"], 1)
+            progress["status"] = "done"
+            logger.info(f"Re-indexed {progress['documents']} documents and {progress['passages']} passages "
+                        f"in {progress['seconds']}s")
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            logger.error(f"Re-index failed: {e}")
+        finally:
+            self.search_cache.invalidate()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued writes are in chroma and synced to GCS (no-op without write-behind)"""
+        return self.write_queue.flush(timeout) if self.write_queue else True
+
+    def write_report(self) -> Dict:
+        """Queue depth, batch size and flush latency of the write-behind queue"""
+        return self.write_queue.report() if self.write_queue else {}
     
     
+    def list_content(self, limit: int = 20, offset: int = 0, doc_type: Optional[str] = None,
+                     iteration: Optional[int] = None, chapter_id: Optional[str] = None,
+                     sort: str = "timestamp", descending: bool = True) -> Dict:
+        """
+        One page of stored documents, newest first by default, answered from the document index:
+        {"items": [{"doc_id", "metadata", "preview"}], "total": number of matching documents}.
+        Nothing is embedded and no body is loaded, use get_content for the full text.
+        """
+        self._ensure_ready()
+        return self.versions.list_documents(limit=limit, offset=offset, doc_type=doc_type, iteration=iteration,
+                                            chapter_id=chapter_id, sort=sort, descending=descending)
+
+    def content_types(self) -> List[str]:
+        """Distinct document types, for listing filters"""
+        self._ensure_ready()
+        return self.versions.document_types()
+
+    def _rebuild_document_index(self, page_size: int = 500):
+        """Index the documents stored before the document index existed"""
+        total, offset = 0, 0
+        while True:
+            results = self._collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            if not results["ids"]:
+                break
+            documents = self._bodies(results["ids"], results["documents"], results["metadatas"])
+            total += self.versions.rebuild_documents(results["ids"], documents, results["metadatas"],
+                                                     self.config.CHROMA_PREVIEW_CHARS)
+            offset += page_size
+        logger.info(f"Indexed {total} stored documents for listing")
+
     def get_content(self, doc_id:str)->Optional[Dict]:
         """Retrieve content by document ID, can return optionally if content exists"""
+        self._ensure_ready()
+        if self.write_queue:
+            queued = self.write_queue.pending(doc_id)
+            if queued:
+                return queued
+
         results = self.collection.get(ids=[doc_id])
 
-        if results["documents"]:
+        if results["ids"]:
             return {
-                'content': results['documents'][0],
+                'content': self._bodies(results['ids'], results['documents'], results['metadatas'])[0],
                 'metadata': results['metadatas'][0]
             }
         
         return None 
     
-    def search_content(self, query: str, n_results: int=5)->List[Dict]:
+    def search_content(self, query: str, n_results: int=5, where: Optional[Dict] = None)->List[Dict]:
         """Search content using semantic similarity"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-
-        content_list = [0]
+        return self.search_many([query], n_results=n_results, where=where)[0]
 
-        for i, doc in enumerate(results["documents"][0]):
-            content_list.append({
-                'content':doc,
-                'results': results['metadatas'][0][i],
-                'distance': results['distances'][0][i]
+    def search_many(self, queries: List[str], n_results: int = 5, where: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        Results of every query, in order. Cached results are served from memory, the other
+        queries are embedded and searched together in one collection.query.
+        """
+        self._ensure_ready()
+        generation = self.search_cache.generation
+        results: List[Optional[List[Dict]]] = [
+            self.search_cache.get(SearchCache.key(query, n_results, where)) for query in queries
+        ]
+        # distinct queries still to run
+        missing = list(dict.fromkeys(query for query, cached in zip(queries, results) if cached is None))
+        if missing and self._passages is not None:
+            fresh = self._search_passages(missing, n_results, where)
+            for query, content_list in fresh.items():
+                self.search_cache.put(SearchCache.key(query, n_results, where), content_list, generation)
+            results = [fresh[query] if cached is None else cached for query, cached in zip(queries, results)]
+        elif missing:
+            embeddings = self._embed_queries(missing)
+            query_args = {"query_embeddings": embeddings} if embeddings else {"query_texts": missing}
+            found = self.collection.query(n_results=n_results, where=where, **query_args)
+            fresh = {}
+            for q, query in enumerate(missing):
+                content_list = []
+                documents = self._bodies(found["ids"][q], found["documents"][q], found["metadatas"][q])
+                for i, doc in enumerate(documents):
+                    content_list.append({
+                        'doc_id': found['ids'][q][i],
+                        'content':doc,
+                        'results': found['metadatas'][q][i],
+                        'distance': found['distances'][q][i]
+                    })
+                fresh[query] = content_list
+                self.search_cache.put(SearchCache.key(query, n_results, where), content_list, generation)
+            results = [fresh[query] if cached is None else cached for query, cached in zip(queries, results)]
+
+        # copies, so a caller editing its list does not edit the cached one
+        return [list(result) for result in results]
+
+    def _search_passages(self, queries: List[str], n_results: int, where: Optional[Dict]) -> Dict[str, List[Dict]]:
+        """
+        Hybrid passage search: one vector query over the passage collection for all queries plus
+        an FTS5 keyword search per query, the two rankings merged by reciprocal rank fusion.
+        Each result is the matching passage, with the doc_id and character offset of its document.
+        """
+        candidates = n_results * self.config.CHROMA_HYBRID_CANDIDATES
+        embeddings = self._embed_queries(queries)
+        query_args = {"query_embeddings": embeddings} if embeddings else {"query_texts": queries}
+        found = self._passages.query(n_results=candidates, where=where, **query_args)
+
+        fresh = {}
+        for q, query in enumerate(queries):
+            passages = {
+                passage_id: {'content': document, 'results': metadata, 'distance': distance}
+                for passage_id, document, metadata, distance in zip(
+                    found['ids'][q], found['documents'][q], found['metadatas'][q], found['distances'][q])
+            }
+            keyword_ids = [passage_id for passage_id, score in self.keywords.search(query, candidates)]
+            # keyword hits the vector search did not return, filtered like the vector side
+            extra = [passage_id for passage_id in keyword_ids if passage_id not in passages]
+            if extra:
+                more = self._passages.get(ids=extra, where=where, include=["documents", "metadatas"])
+                for passage_id, document, metadata in zip(more['ids'], more['documents'], more['metadatas']):
+                    passages[passage_id] = {'content': document, 'results': metadata, 'distance': None}
+            keyword_ids = [passage_id for passage_id in keyword_ids if passage_id in passages]
+
+            content_list = []
+            for passage_id, score in rrf_fuse([found['ids'][q], keyword_ids])[:n_results]:
+                passage = passages[passage_id]
+                content_list.append({
+                    'doc_id': passage['results']['doc_id'],
+                    'passage_id': passage_id,
+                    'content': passage['content'],
+                    'results': passage['results'],
+                    'distance': passage['distance'],
+                    'score': score,
+                })
+            fresh[query] = content_list
+        return fresh
+
+    def delta_report(self) -> List[Dict]:
+        """Per chapter, bytes its versions would take as full copies against the bytes actually stored"""
+        self._ensure_ready()
+        report = []
+        for chapter in self.versions.chapters():
+            full_bytes, stored_bytes, delta_stored = 0, 0, 0
+            for metadata in self.versions.history(chapter["chapter_id"], limit=-1):
+                size = metadata.get("content_bytes") or 0
+                full_bytes += size
+                if metadata.get("storage") == "delta":
+                    stored_bytes += self.deltas.stored_bytes(metadata["doc_id"])
+                    delta_stored += 1
+                else:
+                    stored_bytes += size
+            report.append({
+                "chapter_id": chapter["chapter_id"],
+                "versions": chapter["versions"],
+                "delta_stored": delta_stored,
+                "full_bytes": full_bytes,
+                "stored_bytes": stored_bytes,
+                "ratio": round(stored_bytes / full_bytes, 3) if full_bytes else None,
             })
+        return report
 
-        return content_list
-    
+    def search_report(self) -> Dict:
+        """Hit rate, evictions and invalidations of the search result cache, and the query vector LRU stats"""
+        report = self.search_cache.report()
+        if self.query_vectors:
+            report["query_vectors"] = self.query_vectors.report()
+        return report
 
     def get_version(self, chapter_id:str)->List[Dict]:
-        """Get all versions of a specific chapter"""
-
-        results = self.collection.get(
-            where={"chapter_id": chapter_id}
-        )
-
-        versions = []
-
-        for i, doc in enumerate(results['documents'][0]):
-            versions.append({
-                'content': doc,
-                'metadata': results['metadatas'][0][i]
-            }
-            )
-
-        # sort by timestamp
-        versions.sort(key=lambda x: x['metadata']['timestamp'])
-
-        return versions
-
+        """Get all versions of a specific chapter, oldest first"""
+        self._ensure_ready()
+        history = self.versions.history(chapter_id, limit=-1, newest_first=False)
+        contents = self._contents([metadata["doc_id"] for metadata in history])
+        return [
+            {'content': contents.get(metadata["doc_id"]), 'metadata': metadata}
+            for metadata in history
+        ]
+
+    def latest_version(self, chapter_id: str, with_content: bool = False) -> Optional[Dict]:
+        """Metadata of the newest version of the chapter (and its content when asked)"""
+        self._ensure_ready()
+        return self._version_entry(self.versions.latest(chapter_id), with_content)
+
+    def get_chapter_version(self, chapter_id: str, version: int, with_content: bool = False) -> Optional[Dict]:
+        """Metadata of version k of the chapter, versions are numbered from 1"""
+        self._ensure_ready()
+        return self._version_entry(self.versions.get(chapter_id, version), with_content)
+
+    def version_history(self, chapter_id: str, limit: int = 20, offset: int = 0,
+                        newest_first: bool = True, after: Optional[int] = None) -> List[Dict]:
+        """One page of the chapter's version metadata, no document bodies are loaded"""
+        self._ensure_ready()
+        return self.versions.history(chapter_id, limit=limit, offset=offset, newest_first=newest_first, after=after)
+
+    def _version_entry(self, metadata: Optional[Dict], with_content: bool) -> Optional[Dict]:
+        if metadata is None:
+            return None
+        if not with_content:
+            return {'metadata': metadata}
+        return {'content': self._contents([metadata["doc_id"]]).get(metadata["doc_id"]), 'metadata': metadata}
+
+    def _contents(self, doc_ids: List[str]) -> Dict[str, str]:
+        """doc_id -> document for the given ids, queued documents included"""
+        contents = {}
+        if self.write_queue:
+            for doc_id in doc_ids:
+                queued = self.write_queue.pending(doc_id)
+                if queued:
+                    contents[doc_id] = queued['content']
+        missing = [doc_id for doc_id in doc_ids if doc_id not in contents]
+        if missing:
+            results = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            contents.update(zip(results["ids"], self._bodies(results["ids"], results["documents"], results["metadatas"])))
+        return contents
+
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_manager: Optional[ChromaManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_chroma_manager() -> ChromaManager:
+    """Process wide ChromaManager shared by the writer, the workflow and every streamlit session"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ChromaManager()
+        return _manager
@@ -0,0 +1,87 @@
+# chunked_rewrite.py
+# long chapters rewritten as paragraph aligned segments in parallel, with read only context around each, stitched back in order
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# the scraper separates paragraphs with a blank line, single newlines split too
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n|\n")
+
+
+def split_segments(text: str, max_chars: int = 6000, context_paragraphs: int = 2) -> List[Dict]:
+    """
+    Consecutive whole paragraphs grouped into segments of about max_chars (a longer paragraph is a
+    segment of its own, never cut). Segments do not overlap, so stitching never repeats text; instead
+    each carries the context_paragraphs paragraphs before and after it as context for the rewrite.
+    """
+    paragraphs = [paragraph.strip() for paragraph in PARAGRAPH_SPLIT.split(text) if paragraph.strip()]
+    segments, first = [], 0
+    while first < len(paragraphs):
+        last, size = first, len(paragraphs[first])
+        while last + 1 < len(paragraphs) and size + 2 + len(paragraphs[last + 1]) <= max_chars:
+            last += 1
+            size += 2 + len(paragraphs[last])
+        segments.append({
+            "index": len(segments),
+            "text": "\n\n".join(paragraphs[first:last + 1]),
+            "before": "\n\n".join(paragraphs[max(first - context_paragraphs, 0):first]),
+            "after": "\n\n".join(paragraphs[last + 1:last + 1 + context_paragraphs]),
+        })
+        first = last + 1
+    for segment in segments:
+        segment["count"] = len(segments)
+    return segments
+
+
+def stitch(rewrites: List[str]) -> str:
+    """The segment rewrites in order, one blank line apart like the scraped paragraphs"""
+    return "\n\n".join(rewrite.strip() for rewrite in rewrites)
+
+
+async def rewrite_segments(
+    segments: List[Dict],
+    rewrite: Callable[[Dict], Awaitable[str]],
+    concurrency: int = 4,
+    retries: int = 2,
+    backoff: float = 1.0,
+    on_segment: Optional[Callable[[int, str], None]] = None,
+    stats: Optional[Dict] = None,
+) -> List[str]:
+    """
+    Rewrites of the segments in order, at most concurrency running at once. A failed (or empty)
+    segment is retried on its own, up to retries more times with exponential backoff, the others
+    keep their results; the chapter fails only when a segment fails every attempt, and then the
+    segments still running or waiting are cancelled so they spend no more calls.
+    on_segment(index, text) is called as each segment completes.
+    """
+    slots = asyncio.Semaphore(max(concurrency, 1))
+    stats = stats if stats is not None else {}
+    stats.setdefault("retries", 0)
+
+    async def run(segment: Dict) -> str:
+        for attempt in range(retries + 1):
+            try:
+                async with slots:
+                    text = await rewrite(segment)
+                if not text or not text.strip():
+                    raise ValueError("empty rewrite")
+                if on_segment is not None:
+                    on_segment(segment["index"], text)
+                return text
+            except Exception as e:
+                if attempt == retries:
+                    raise RuntimeError(f"segment {segment['index'] + 1}/{segment['count']} failed: {e}") from e
+                stats["retries"] += 1
+                logger.warning(f"Rewrite of segment {segment['index'] + 1}/{segment['count']} failed ({e}), retrying")
+                await asyncio.sleep(backoff * 2 ** attempt)
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(run(segment)) for segment in segments]
+    except ExceptionGroup as failed:
+        # the segment that failed for good, its siblings were cancelled by the task group
+        raise failed.exceptions[0]
+    return [task.result() for task in tasks]
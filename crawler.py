@@ -0,0 +1,189 @@
+# crawler.py
+# whole book crawl mode, discovers the chapter sequence of a wikisource book and scrapes the chapters concurrently
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urljoin, urlparse
+# it is used to parse the html data(beautifulsoup used to parse the web scrap data)
+from bs4 import BeautifulSoup
+from utils.config import Config
+from scraper import ContentScraper
+from extraction import CONTENT_STRAINER, PARSER
+
+logger = logging.getLogger(__name__)
+
+
+class HostLimiter:
+    """Per host politeness: at most `limit` requests in flight and `delay` seconds between request starts"""
+    def __init__(self, limit: int, delay: float):
+        self.limit = limit
+        self.delay = delay
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._last_start: Dict[str, float] = defaultdict(float)
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.limit)
+        return self._semaphores[host]
+
+    async def __call__(self, url: str, coro_fn):
+        host = urlparse(url).netloc
+        async with self._semaphore(host):
+            # space out request starts on the same host
+            async with self._locks[host]:
+                wait = self._last_start[host] + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._last_start[host] = time.monotonic()
+            return await coro_fn()
+
+
+class BookCrawler:
+    """
+    Crawl a whole book starting from a wikisource book or chapter url.
+    The chapter sequence comes from the table of contents (links to sub pages of the book),
+    falling back to following the header "next" links chapter by chapter.
+    """
+    def __init__(self, start_url: str, max_workers: Optional[int] = None,
+                 per_host_limit: Optional[int] = None, per_host_delay: Optional[float] = None,
+                 max_chapters: Optional[int] = None):
+        self.config = Config()
+        self.start_url = start_url
+        self.max_workers = max_workers or self.config.CRAWL_MAX_WORKERS
+        self.max_chapters = max_chapters or self.config.CRAWL_MAX_CHAPTERS
+        self.host_limiter = HostLimiter(
+            per_host_limit or self.config.CRAWL_PER_HOST_LIMIT,
+            self.config.CRAWL_PER_HOST_DELAY if per_host_delay is None else per_host_delay,
+        )
+        self.scraper = ContentScraper(start_url)
+
+    # ---- page helpers ----
+    async def _fetch_html(self, url: str) -> str:
+        if self.config.HTTP_FIRST_FETCH:
+            try:
+                response = await self.host_limiter(url, lambda: self.scraper.http.get(url))
+                if response.status_code == 200:
+                    return response.text
+            except Exception as e:
+                logger.debug(f"HTTP fetch of {url} failed, falling back to browser: {e}")
+
+        async def load(page):
+            if self.config.SCRAPER_BLOCK_RESOURCES:
+                await self.scraper.install_request_policy(page, url, {})
+            await page.goto(url, wait_until="domcontentloaded")
+            return await page.content()
+        return await self.host_limiter(url, lambda: self.scraper.browser_pool.run(load))
+
+    @staticmethod
+    def _wiki_title(url: str) -> str:
+        """'https://en.wikisource.org/wiki/A/B_1' -> 'A/B_1'"""
+        path = urlparse(url).path
+        return unquote(path.split("/wiki/", 1)[1]) if "/wiki/" in path else ""
+
+    def _toc_links(self, html: str, base_url: str) -> List[Dict]:
+        """Links to sub pages of base_url inside the page content, in document order"""
+        # only the content container is parsed
+        soup = BeautifulSoup(html, PARSER, parse_only=CONTENT_STRAINER)
+        main_content = soup.find('div', {'class': 'mw-parser-output'})
+        if not main_content:
+            return []
+
+        parent = self._wiki_title(base_url).rstrip("/")
+        chapters, seen = [], set()
+        for link in main_content.find_all('a', href=True):
+            url = urljoin(base_url, link['href']).split("#", 1)[0]
+            title = self._wiki_title(url)
+            # sub pages of the book at any depth, e.g. Chapter_3 or Book_1/Chapter_3
+            if not title.startswith(parent + "/") or url in seen:
+                continue
+            seen.add(url)
+            chapters.append({"url": url, "title": link.get_text(strip=True) or None, "wiki_title": title})
+        # a page with listed sub pages of its own is a part index (Book_1 next to Book_1/Chapter_1), not a chapter
+        titles = {chapter["wiki_title"] for chapter in chapters}
+        return [
+            {"url": chapter["url"], "title": chapter["title"]}
+            for chapter in chapters
+            if not any(other.startswith(chapter["wiki_title"] + "/") for other in titles)
+        ]
+
+    def _next_link(self, html: str, base_url: str) -> Optional[str]:
+        """Header 'next chapter' link of a wikisource page"""
+        soup = BeautifulSoup(html, 'html.parser')
+        for selector in ("#headernext a", ".wst-header-next a", "a[rel=next]"):
+            link = soup.select_one(selector)
+            if link and link.get('href'):
+                return urljoin(base_url, link['href']).split("#", 1)[0]
+        return None
+
+    # ---- chapter discovery ----
+    async def discover_chapters(self) -> List[Dict]:
+        """Ordered chapter list [{'url', 'title'}] for the book the start url belongs to"""
+        html = await self._fetch_html(self.start_url)
+
+        # start url is the book page with a table of contents
+        chapters = self._toc_links(html, self.start_url)
+
+        # start url is a chapter, try the table of contents on its parent page
+        title = self._wiki_title(self.start_url)
+        if not chapters and "/" in title:
+            parent_url = self.start_url.rsplit("/", 1)[0]
+            chapters = self._toc_links(await self._fetch_html(parent_url), parent_url)
+
+        # no table of contents, walk the next chapter links from the start page
+        if not chapters:
+            chapters = [{"url": self.start_url, "title": None}]
+            seen = {self.start_url}
+            next_url = self._next_link(html, self.start_url)
+            while next_url and next_url not in seen and len(chapters) < self.max_chapters:
+                seen.add(next_url)
+                chapters.append({"url": next_url, "title": None})
+                next_url = self._next_link(await self._fetch_html(next_url), next_url)
+
+        chapters = chapters[:self.max_chapters]
+        logger.info(f"Discovered {len(chapters)} chapters from {self.start_url}")
+        return chapters
+
+    # ---- crawl ----
+    async def crawl(self) -> Dict:
+        """Scrape every chapter concurrently and write one ordered manifest of chapter records"""
+        await self.scraper.setup_directories()
+        start = time.perf_counter()
+        chapters = await self.discover_chapters()
+
+        workers = asyncio.Semaphore(self.max_workers)
+
+        async def scrape(index: int, chapter: Dict) -> Dict:
+            async with workers:
+                record = await self.host_limiter(
+                    chapter["url"],
+                    lambda: self.scraper.scrape_chapter(chapter["url"], chapter_number=index),
+                )
+            if record is None:
+                return {"chapter_number": index, "url": chapter["url"], "status": "failed"}
+            # the text stays in the scrape store, the manifest points to it by content_hash
+            return {**{key: value for key, value in record.items() if key != "content"}, "status": "scraped"}
+
+        # gather keeps the chapter order regardless of completion order
+        records = await asyncio.gather(*(scrape(i, c) for i, c in enumerate(chapters, start=1)))
+
+        manifest = {
+            "start_url": self.start_url,
+            "timestamp": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "chapter_count": len(records),
+            "failed": sum(1 for r in records if r["status"] == "failed"),
+            "elapsed_seconds": round(time.perf_counter() - start, 2),
+            "chapters": records,
+        }
+
+        manifest_path = f"{self.scraper.content_dir}/book_manifest_{manifest['timestamp']}.json"
+        with open(manifest_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2, ensure_ascii=False)
+        manifest["manifest_path"] = manifest_path
+
+        print(f"Crawled {manifest['chapter_count']} chapters ({manifest['failed']} failed) in {manifest['elapsed_seconds']}s")
+        return manifest
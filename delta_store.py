@@ -0,0 +1,124 @@
+# delta_store.py
+# chapter versions stored as compressed line deltas against the previous version, with periodic full keyframes
+import difflib
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
+
+def encode_delta(base: str, text: str) -> List[Union[List[int], str]]:
+    """
+    Line level delta of text against base: [start, end] copies base lines start:end,
+    a string is inserted as is. Lines keep their line endings, so decoding is exact.
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def decode_delta(base: str, ops: List[Union[List[int], str]]) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]]) for op in ops)
+
+
+class DeltaStore:
+    """
+    One gzip object per version under <root>/<doc_id[:2]>/<doc_id>.gz, either a keyframe holding
+    the full text or a delta against the version it was based on. A chain never gets longer than
+    the keyframe interval, and recently reconstructed texts are kept in a small LRU so walking a
+    chapter's history does not decode the same chain again. Objects are written once and never
+    changed, so a directory sync only sends the new ones.
+    """
+    def __init__(self, root: str, keyframe_interval: int = 10, cache_size: int = 32):
+        self.root = root
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.root, doc_id[:2], f"{doc_id}.gz")
+
+    def exists(self, doc_id: str) -> bool:
+        return os.path.exists(self._path(doc_id))
+
+    def _read(self, doc_id: str) -> Dict:
+        with gzip.open(self._path(doc_id), 'rt', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _write(self, doc_id: str, entry: Dict) -> int:
+        path = self._path(doc_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=9) as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _remember(self, doc_id: str, text: str):
+        self._cache[doc_id] = text
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, doc_id: str, text: str, base_doc_id: Optional[str] = None) -> Dict:
+        """
+        Store a version. With its base (the previous version) in the store it is stored as a delta,
+        unless the chain since the last keyframe has reached the keyframe interval.
+        """
+        with self._lock:
+            entry = None
+            if base_doc_id and self.exists(base_doc_id):
+                depth = self._read(base_doc_id).get("depth", 0) + 1
+                if depth < self.keyframe_interval:
+                    entry = {"base": base_doc_id, "depth": depth, "ops": encode_delta(self._text(base_doc_id), text)}
+            if entry is None:
+                entry = {"base": None, "depth": 0, "text": text}
+            stored = self._write(doc_id, entry)
+            self._remember(doc_id, text)
+        return {"keyframe": entry["base"] is None, "stored_bytes": stored}
+
+    def get(self, doc_id: str) -> Optional[str]:
+        """Full text of a version, rebuilt from its keyframe"""
+        with self._lock:
+            if not self.exists(doc_id):
+                return None
+            return self._text(doc_id)
+
+    def _text(self, doc_id: str) -> str:
+        if doc_id in self._cache:
+            self._cache.move_to_end(doc_id)
+            return self._cache[doc_id]
+        # walk back to the keyframe (or a cached version), then apply the deltas forward
+        chain = []
+        current, text = doc_id, None
+        while True:
+            if current in self._cache:
+                text = self._cache[current]
+                break
+            entry = self._read(current)
+            if entry["base"] is None:
+                text = entry["text"]
+                self._remember(current, text)
+                break
+            chain.append(entry)
+            current = entry["base"]
+        for entry in reversed(chain):
+            text = decode_delta(text, entry["ops"])
+        self._remember(doc_id, text)
+        return text
+
+    def stored_bytes(self, doc_id: str) -> int:
+        path = self._path(doc_id)
+        return os.path.getsize(path) if os.path.exists(path) else 0
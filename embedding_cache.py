@@ -0,0 +1,106 @@
+# embedding_cache.py
+# persistent embedding cache keyed by content hash and embedding model, so identical texts are embedded once
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """sha256 of the text, the same hash the scrape store uses for its objects"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    (model id, content hash) -> embedding, in a small sqlite file next to the chroma directory.
+    embed(texts) looks every text up by hash, runs embed_fn once over the misses only and stores
+    their vectors, so a text already seen by this model is never embedded again.
+    Vectors are kept as float32, the precision chroma stores them in.
+    """
+    def __init__(self, path: str, model_id: str, embed_fn: Callable[[List[str]], List]):
+        self.path = path
+        self.model_id = model_id
+        self.embed_fn = embed_fn
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (model, content_hash))"
+        )
+        self._db.commit()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "embed_calls": 0,
+            "embed_seconds": 0.0,  # time spent in the embedding model, what the hits save
+        }
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, bytes]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # sqlite caps the number of bound parameters, look up in slices
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND content_hash IN ({','.join('?' * len(chunk))})",
+                    (self.model_id, *chunk),
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def embed(self, texts: List[str], refresh: bool = False) -> List[List[float]]:
+        """
+        Embeddings of the texts in order, computed only for texts not cached for this model.
+        refresh computes every text again and replaces the cached vectors.
+        """
+        import numpy as np
+
+        hashes = [content_hash(text) for text in texts]
+        found = {} if refresh else self._lookup(hashes)
+
+        # one model call for all distinct missing texts
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        if missing:
+            start = time.perf_counter()
+            vectors = self.embed_fn(list(missing.values()))
+            self.stats["embed_seconds"] += time.perf_counter() - start
+            self.stats["embed_calls"] += 1
+            now = time.time()
+            rows = []
+            for text_hash, vector in zip(missing, vectors):
+                found[text_hash] = np.asarray(vector, dtype=np.float32).tobytes()
+                rows.append((self.model_id, text_hash, found[text_hash], now))
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+        self.stats["misses"] += len(missing)
+        self.stats["hits"] += len(texts) - len(missing)
+        return [np.frombuffer(found[text_hash], dtype=np.float32).tolist() for text_hash in hashes]
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_id,)
+            ).fetchone()[0]
+
+    def report(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "embed_seconds": round(self.stats["embed_seconds"], 3),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "model": self.model_id,
+            "cached_embeddings": self.size(),
+        }
@@ -0,0 +1,98 @@
+# embedding_executor.py
+# embeddings computed in a pool of worker processes, off the streamlit and langgraph threads and their GIL
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# the embedding function of a worker process, built once by _init_worker
+_worker_function = None
+
+
+def default_embedding_function():
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    return DefaultEmbeddingFunction()
+
+
+def _init_worker(factory: Callable):
+    global _worker_function
+    _worker_function = factory()
+
+
+def _embed_batch(texts: List[str]) -> List:
+    return list(_worker_function(texts))
+
+
+class EmbeddingExecutor:
+    """
+    Splits texts into batches of batch_size and embeds them in parallel in a pool of worker
+    processes, each loading its own copy of the model (factory must be a picklable, module level callable).
+    The pool uses spawn, forking a process that runs streamlit and browser threads is not safe.
+    Calls block the calling thread only on a future, the embedding itself never holds its GIL.
+    """
+    def __init__(self, workers: int, batch_size: int, factory: Callable = default_embedding_function):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.factory = factory
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "texts": 0, "batches": 0, "seconds": 0.0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # started on first use, the workers load the model once each
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.factory,),
+                )
+                logger.info(f"Started {self.workers} embedding worker processes")
+            return self._pool
+
+    def __call__(self, texts: List[str]) -> List:
+        """Embeddings of the texts, in order"""
+        if not texts:
+            return []
+        start = time.perf_counter()
+        pool = self._get_pool()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        embeddings = []
+        try:
+            for result in pool.map(_embed_batch, batches):
+                embeddings.extend(result)
+        except BrokenProcessPool:
+            # a worker died (or could not start), the next call starts a fresh pool
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += len(batches)
+            self.stats["seconds"] += time.perf_counter() - start
+        return embeddings
+
+    def report(self) -> Dict:
+        seconds = self.stats["seconds"]
+        return {
+            **self.stats,
+            "seconds": round(seconds, 3),
+            "texts_per_second": round(self.stats["texts"] / seconds, 1) if seconds else None,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+        }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,86 @@
+# extraction.py
+# targeted mediawiki content extraction, only the content container is parsed and split into clean paragraphs
+import html as html_lib
+import re
+from typing import List, Optional, Tuple
+# it is used to parse the html data(beautifulsoup used to parse the web scrap data)
+from bs4 import BeautifulSoup, SoupStrainer
+
+# lxml is much faster than the pure python parser, use it when it is installed
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# only the content container is built into a tree, the rest of the page is skipped while parsing
+CONTENT_STRAINER = SoupStrainer("div", class_="mw-parser-output")
+
+TITLE_PATTERN = re.compile(r'<h1[^>]*\bid="firstHeading"[^>]*>(.*?)</h1>', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# wikisource header / navigation boxes, footnote markers and edit links inside the content container
+NOISE_SELECTORS = ", ".join([
+    "script", "style", "sup.reference", "ol.references", ".mw-references-wrap", ".mw-editsection",
+    ".noprint", ".ws-noexport", "#headertemplate", ".wst-header", ".ws-header",
+])
+
+# paragraph level elements, each one becomes one paragraph
+BLOCK_TAGS = ["p", "h2", "h3", "h4", "h5", "h6", "li", "dd", "blockquote", "pre"]
+
+# one pass normalizer: arrows, "Layout 2" labels and [1] footnote markers are dropped together with
+# the whitespace in front of them, any other whitespace run becomes a single space
+NORMALIZE_PATTERN = re.compile(r"(?P<noise>\s*(?:[←→]|Layout\s*\d+|\[\s*\d+\s*\]))|(?P<space>\s+)")
+
+
+def normalize(text: str) -> str:
+    """Clean one paragraph of text in a single regex pass"""
+    return NORMALIZE_PATTERN.sub(lambda m: "" if m.lastgroup == "noise" else " ", text).strip()
+
+
+def normalize_paragraphs(texts: List[str]) -> List[str]:
+    """Clean each paragraph and drop the ones left empty"""
+    return [paragraph for paragraph in map(normalize, texts) if paragraph]
+
+
+def page_title(html: str) -> Optional[str]:
+    """Readable title from the mediawiki heading, e.g. 'Book/Chapter 1' -> 'Book - Chapter 1'"""
+    match = TITLE_PATTERN.search(html)
+    if not match:
+        return None
+    heading = html_lib.unescape(TAG_PATTERN.sub("", match.group(1))).strip()
+    if not heading:
+        return None
+    return " - ".join(part.strip() for part in heading.split("/"))
+
+
+def extract_paragraphs(html: str) -> Optional[Tuple[Optional[str], List[str]]]:
+    """(title, paragraphs) of the mediawiki content container, None when the page has none"""
+    soup = BeautifulSoup(html, PARSER, parse_only=CONTENT_STRAINER)
+    main_content = soup.find("div", {"class": "mw-parser-output"})
+    if not main_content:
+        return None
+
+    for element in main_content.select(NOISE_SELECTORS):
+        element.decompose()
+    # verse, letters and poems break lines with <br>, keep the words on either side apart
+    for line_break in main_content.find_all("br"):
+        line_break.replace_with("\n")
+
+    blocks = [block for block in main_content.find_all(BLOCK_TAGS) if block.find_parent(BLOCK_TAGS) is None]
+    if blocks:
+        texts = [block.get_text() for block in blocks]
+    else:
+        # container without paragraph markup, fall back to its text lines
+        texts = main_content.get_text(separator="\n").split("\n")
+
+    return page_title(html), normalize_paragraphs(texts)
+
+
+# runs inside the browser: returns only the heading and the content container instead of the whole page
+CONTAINER_SCRIPT = """(selector) => {
+    const container = document.querySelector(selector);
+    if (!container) return document.documentElement.outerHTML;
+    const heading = document.querySelector('h1#firstHeading');
+    return `<h1 id="firstHeading">${heading ? heading.innerHTML : ''}</h1>` + container.outerHTML;
+}"""
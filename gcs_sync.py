@@ -0,0 +1,341 @@
+# gcs_sync.py
+# incremental sync of the local chroma directory to a GCS bucket, only changed files are uploaded
+import base64
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+# crc32c is the checksum GCS keeps for every object, it comes with google-cloud-storage
+import google_crc32c
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def file_crc32c(path: str) -> str:
+    """Base64 big endian crc32c of a file, same encoding as the crc32c property of a GCS blob"""
+    checksum = google_crc32c.Checksum()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+class LocalBlob:
+    """Local file standing in for a google.cloud.storage Blob"""
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def size(self) -> Optional[int]:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    @property
+    def updated(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(os.stat(self.path).st_mtime_ns / 1e9, tz=timezone.utc) if os.path.exists(self.path) else None
+
+    @property
+    def generation(self) -> Optional[int]:
+        return os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def upload_from_filename(self, filename: str):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def download_to_filename(self, filename: str):
+        shutil.copyfile(self.path, filename)
+
+    def upload_from_string(self, data, content_type: Optional[str] = None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as file:
+            file.write(data.encode('utf-8') if isinstance(data, str) else data)
+
+    def download_as_bytes(self) -> bytes:
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class LocalBucket:
+    """
+    Directory standing in for a google.cloud.storage Bucket, implements the part of the
+    bucket api the sync uses (blob, list_blobs), for benchmarks and local runs without GCS.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self.name = f"local:{root}"
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+    def list_blobs(self, prefix: str = "") -> Iterator[LocalBlob]:
+        for root, dirs, files in os.walk(self.root):
+            for file in files:
+                name = os.path.relpath(os.path.join(root, file), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    yield LocalBlob(self, name)
+
+
+class SnapshotSync:
+    """
+    Mirrors a local directory to <prefix> in a bucket. A manifest of size, mtime and crc32c
+    of every file at its last sync is kept next to the directory: files whose size and mtime
+    did not move are skipped without reading them, files whose crc32c did not change are
+    skipped without uploading, and the rest are uploaded in parallel by a bounded worker pool.
+    Files removed locally are deleted from the bucket.
+    With compress on, files are stored gzip compressed as <name>.gz. Only one form of a file is kept:
+    an upload deletes the other form, a delete removes both, and when both are found (a bucket written
+    before this) restore takes the newer one.
+    Every push that changed something writes a new generation marker next to the prefix, and restore()
+    skips the download when the local directory already holds that generation.
+    """
+    def __init__(self, bucket, local_dir: str, prefix: Optional[str] = None,
+                 max_workers: Optional[int] = None, manifest_path: Optional[str] = None,
+                 compress: Optional[bool] = None):
+        self.config = Config()
+        self.bucket = bucket
+        self.local_dir = local_dir
+        self.prefix = prefix or self.config.GCS_CHROMA_PREFIX
+        self.max_workers = max_workers or self.config.GCS_SYNC_MAX_WORKERS
+        self.compress = self.config.GCS_SYNC_COMPRESS if compress is None else compress
+        # outside the synced directory, so it is never uploaded itself
+        self.manifest_path = manifest_path or f"{os.path.normpath(local_dir)}.sync.json"
+        self.generation_path = f"{os.path.splitext(self.manifest_path)[0]}.generation"
+        # e.g. "chroma_db.generation", outside the prefix so it is not listed as a snapshot file
+        self.marker_name = f"{self.prefix.rstrip('/')}.generation"
+        self._lock = threading.Lock()
+        self.manifest: Dict[str, Dict] = self._load_manifest()
+        self.last_push: Dict = {}
+        self.last_restore: Dict = {}
+
+    # ---- manifest ----
+    def _load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _blob_name(self, relative: str) -> str:
+        return f"{self.prefix}{relative}.gz" if self.compress else f"{self.prefix}{relative}"
+
+    def _other_blob_name(self, relative: str) -> str:
+        """The form of the file the current compress setting does not write"""
+        return f"{self.prefix}{relative}" if self.compress else f"{self.prefix}{relative}.gz"
+
+    def _delete_blob(self, name: str):
+        try:
+            self.bucket.blob(name).delete()
+        except Exception as e:
+            # usually not found, the form was never written
+            logger.debug(f"Deleting {name} failed: {e}")
+
+    @staticmethod
+    def _blob_age(blob) -> Tuple[float, int]:
+        """Sort key of a listed blob, later writes sort higher"""
+        updated = getattr(blob, "updated", None)
+        return (updated.timestamp() if updated else 0.0, getattr(blob, "generation", None) or 0)
+
+    def _local_files(self) -> Dict[str, os.stat_result]:
+        files = {}
+        for root, dirs, names in os.walk(self.local_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, self.local_dir).replace(os.sep, "/")] = os.stat(path)
+        return files
+
+    def mark_synced(self, relatives: Optional[Iterable[str]] = None):
+        """
+        Record local files as already in the bucket, e.g. right after a download. With relatives given
+        only those are recorded, any other local file stays out of the manifest and the next push uploads it.
+        """
+        with self._lock:
+            local_files = self._local_files()
+            if relatives is not None:
+                local_files = {relative: local_files[relative] for relative in relatives if relative in local_files}
+            self.manifest = {
+                relative: {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "crc32c": file_crc32c(os.path.join(self.local_dir, relative)),
+                }
+                for relative, stat in local_files.items()
+            }
+            self._save_manifest()
+
+    # ---- generation marker ----
+    def remote_generation(self) -> Optional[str]:
+        try:
+            return json.loads(self.bucket.blob(self.marker_name).download_as_bytes())["generation"]
+        except Exception:
+            # no marker yet (snapshot written before markers existed, or an empty bucket)
+            return None
+
+    def local_generation(self) -> Optional[str]:
+        try:
+            with open(self.generation_path, 'r', encoding='utf-8') as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def _set_local_generation(self, generation: Optional[str]):
+        if generation is None:
+            return
+        with open(self.generation_path, 'w', encoding='utf-8') as file:
+            file.write(generation)
+
+    def _publish_generation(self, stats: Dict):
+        generation = uuid.uuid4().hex
+        marker = {"generation": generation, "files": len(self.manifest),
+                  "bytes": sum(entry["size"] for entry in self.manifest.values())}
+        self.bucket.blob(self.marker_name).upload_from_string(json.dumps(marker), content_type="application/json")
+        self._set_local_generation(generation)
+        stats["generation"] = generation
+
+    # ---- restore ----
+    def restore(self) -> Dict:
+        """Download the snapshot into the local directory, in parallel, unless it already holds the latest generation"""
+        with self._lock:
+            start = time.perf_counter()
+            remote = self.remote_generation()
+            if remote is not None and remote == self.local_generation() and os.listdir(self.local_dir):
+                self.last_restore = {"skipped": True, "generation": remote, "files": 0, "bytes_downloaded": 0,
+                                     "seconds": round(time.perf_counter() - start, 3)}
+                logger.info(f"Local {self.local_dir} already holds snapshot generation {remote}, download skipped")
+                return self.last_restore
+
+            # relative path -> blob, when both a plain and a compressed copy exist the newer one wins
+            blobs = {}
+            for blob in self.bucket.list_blobs(prefix=self.prefix):
+                relative = blob.name[len(self.prefix):]
+                if not relative or blob.name.endswith("/"):  # skip directory markers
+                    continue
+                compressed = relative.endswith(".gz")
+                relative = relative[:-3] if compressed else relative
+                if relative not in blobs or self._blob_age(blob) > self._blob_age(blobs[relative][0]):
+                    blobs[relative] = (blob, compressed)
+
+            def download(relative: str) -> int:
+                blob, compressed = blobs[relative]
+                local_file_path = os.path.join(self.local_dir, relative)
+                os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+                if compressed:
+                    data = blob.download_as_bytes()
+                    with open(local_file_path, 'wb') as file:
+                        file.write(gzip.decompress(data))
+                    return len(data)
+                blob.download_to_filename(local_file_path)
+                return os.path.getsize(local_file_path)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                transferred = sum(pool.map(download, blobs))
+
+            self._set_local_generation(remote)
+            self.last_restore = {"skipped": False, "generation": remote, "files": len(blobs),
+                                 "bytes_downloaded": transferred, "seconds": round(time.perf_counter() - start, 3)}
+            logger.info(f"Restored {len(blobs)} files ({transferred} bytes) from {self.bucket.name}/{self.prefix} "
+                        f"in {self.last_restore['seconds']}s")
+        # only what was just downloaded is known to be in the bucket, local files it lacks (an existing
+        # local db on a first deploy, a fresh bucket) stay out of the manifest so the next push uploads them
+        self.mark_synced(blobs)
+        return self.last_restore
+
+    # ---- push ----
+    def push(self) -> Dict:
+        """Upload changed files and delete removed ones, returns the transfer stats"""
+        with self._lock:
+            start = time.perf_counter()
+            stats = {"checked": 0, "uploaded": 0, "deleted": 0, "unchanged": 0, "bytes_uploaded": 0}
+            changed = {}
+
+            local_files = self._local_files()
+            for relative, stat in local_files.items():
+                stats["checked"] += 1
+                known = self.manifest.get(relative)
+                # cheap check first: same size and mtime means the file was not touched
+                if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                    stats["unchanged"] += 1
+                    continue
+                entry = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "crc32c": file_crc32c(os.path.join(self.local_dir, relative)),
+                }
+                # touched but same bytes, only the manifest needs the new mtime
+                if known and known["crc32c"] == entry["crc32c"]:
+                    stats["unchanged"] += 1
+                    self.manifest[relative] = entry
+                    continue
+                changed[relative] = entry
+
+            removed = [relative for relative in self.manifest if relative not in local_files]
+
+            def upload(relative: str) -> int:
+                path = os.path.join(self.local_dir, relative)
+                if self.compress:
+                    with open(path, 'rb') as file:
+                        data = gzip.compress(file.read(), compresslevel=6)
+                    self.bucket.blob(self._blob_name(relative)).upload_from_string(data, content_type="application/gzip")
+                    logger.debug(f"Uploaded {relative} to {self._blob_name(relative)} ({len(data)} bytes compressed)")
+                    sent = len(data)
+                else:
+                    self.bucket.blob(self._blob_name(relative)).upload_from_filename(path)
+                    logger.debug(f"Uploaded {relative} to {self._blob_name(relative)}")
+                    sent = os.path.getsize(path)
+                # a copy in the other form (written with the other compress setting) would be stale now
+                self._delete_blob(self._other_blob_name(relative))
+                return sent
+
+            def delete(relative: str):
+                self._delete_blob(self._blob_name(relative))
+                self._delete_blob(self._other_blob_name(relative))
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                uploads = {relative: pool.submit(upload, relative) for relative in changed}
+                deletes = [pool.submit(delete, relative) for relative in removed]
+
+            for relative, future in uploads.items():
+                try:
+                    sent = future.result()
+                except Exception as e:
+                    # left out of the manifest, so the next push retries it
+                    logger.error(f"Failed to upload {relative} to GCS: {e}")
+                    continue
+                self.manifest[relative] = changed[relative]
+                stats["uploaded"] += 1
+                stats["bytes_uploaded"] += sent
+            for future, relative in zip(deletes, removed):
+                future.result()
+                self.manifest.pop(relative, None)
+                stats["deleted"] += 1
+
+            self._save_manifest()
+            if stats["uploaded"] or stats["deleted"]:
+                self._publish_generation(stats)
+            stats["seconds"] = round(time.perf_counter() - start, 3)
+            self.last_push = stats
+            logger.info(f"Synced {self.local_dir} to {self.bucket.name}/{self.prefix}: "
+                        f"{stats['uploaded']} uploaded ({stats['bytes_uploaded']} bytes), "
+                        f"{stats['deleted']} deleted, {stats['unchanged']} unchanged in {stats['seconds']}s")
+            return stats
@@ -0,0 +1,71 @@
+# http_fetch.py
+# plain async http fetch for static mediawiki pages, the scraper only escalates to the browser when this finds nothing
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import unquote, urlencode, urlparse
+import httpx
+from utils.config import Config
+from browser_pool import get_browser_pool
+
+logger = logging.getLogger(__name__)
+
+
+class HttpFetcher:
+    """
+    Keep-alive http client shared by all the scrapes of the process.
+    An httpx.AsyncClient is bound to the event loop it is used on, so the client lives
+    on the browser pool loop (which outlives the per click asyncio.run of streamlit).
+    """
+    def __init__(self):
+        self.config = Config()
+        self.pool = get_browser_pool()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # only called on the pool loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.config.HTTP_FETCH_TIMEOUT,
+                follow_redirects=True,
+                # wikimedia sites reject requests without a descriptive user agent
+                headers={"User-Agent": self.config.HTTP_USER_AGENT},
+            )
+        return self._client
+
+    async def _get(self, url: str, headers: Optional[Dict] = None) -> httpx.Response:
+        return await self._get_client().get(url, headers=headers)
+
+    async def get(self, url: str, headers: Optional[Dict] = None) -> httpx.Response:
+        """GET the url, callable from any event loop"""
+        return await asyncio.wrap_future(self.pool.submit(self._get(url, headers)))
+
+    @staticmethod
+    def parse_api_url(url: str) -> Optional[str]:
+        """MediaWiki parse endpoint for a /wiki/<title> page url"""
+        parsed = urlparse(url)
+        if "/wiki/" not in parsed.path:
+            return None
+        title = unquote(parsed.path.split("/wiki/", 1)[1])
+        query = urlencode({
+            "action": "parse",
+            "page": title,
+            "prop": "text|displaytitle",
+            "format": "json",
+            "formatversion": "2",
+        })
+        return f"{parsed.scheme}://{parsed.netloc}/w/api.php?{query}"
+
+
+_fetcher: Optional[HttpFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_http_fetcher() -> HttpFetcher:
+    """Process wide http fetcher used by every ContentScraper"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = HttpFetcher()
+        return _fetcher
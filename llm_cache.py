@@ -0,0 +1,125 @@
+# llm_cache.py
+# persistent llm response cache keyed by model, generation config and prompt hash, so a repeated prompt costs no call
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _plain(value):
+    """json friendly form of prompt parts and configs (genai types are pydantic models)"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+
+def response_key(model: str, contents, config=None) -> str:
+    """sha256 of the model name, the generation config and the prompt"""
+    payload = json.dumps(
+        {"model": model, "config": _plain(config), "contents": _plain(contents)},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    key -> serialized response, in a sqlite file. Entries older than ttl seconds are not served
+    (and dropped), above max_entries the least recently used ones are evicted.
+    Each entry keeps the latency of the call that produced it, so a hit also reports the time it saved.
+    Hits, misses and writes are counted per agent.
+    """
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, agent TEXT, response TEXT NOT NULL, "
+            "latency_seconds REAL NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)")
+        self._db.commit()
+        self.stats: Dict[str, Dict] = {}
+
+    def _agent_stats(self, agent: Optional[str]) -> Dict:
+        return self.stats.setdefault(agent or "-", {"hits": 0, "misses": 0, "writes": 0, "saved_seconds": 0.0})
+
+    def get(self, key: str, agent: Optional[str] = None) -> Optional[str]:
+        """The cached response, None on a miss or an expired entry"""
+        now = time.time()
+        with self._lock:
+            stats = self._agent_stats(agent)
+            row = self._db.execute(
+                "SELECT response, latency_seconds, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                row = None
+            if row is None:
+                stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            stats["hits"] += 1
+            stats["saved_seconds"] += row[1]
+            return row[0]
+
+    def put(self, key: str, model: str, response: str, latency_seconds: float, agent: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, agent, response, latency_seconds, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, agent, response, latency_seconds, now, now),
+            )
+            # least recently used entries above the size limit
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+            self._agent_stats(agent)["writes"] += 1
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def report(self) -> Dict:
+        """Entries, and per agent hits, misses, hit rate and the call time the hits saved"""
+        agents = {}
+        with self._lock:
+            for agent, stats in self.stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                agents[agent] = {
+                    **stats,
+                    "saved_seconds": round(stats["saved_seconds"], 3),
+                    "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+                }
+        return {"entries": self.count(), "max_entries": self.max_entries, "ttl": self.ttl, "agents": agents}
@@ -0,0 +1,287 @@
+# llm_gateway.py
+# one shared gemini client for every agent and streamlit session, with per model concurrency limits and call stats
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+import httpx
+from google import genai
+from google.genai.types import Candidate, Content, GenerateContentResponse, HttpOptions, Part
+from llm_cache import LLMResponseCache, response_key
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# marks the end of a stream in the queue between the gateway loop and the consumer
+_END = object()
+
+
+class LLMGateway:
+    """
+    Process wide genai.Client (vertex ai) shared by the writer, reviewer, manager and quality agents.
+    Its http clients keep a bounded pool of keep-alive connections, so sockets and client construction
+    no longer grow with the number of sessions. Calls to a model wait for one of its concurrency slots
+    (LLM_MAX_CONCURRENCY, or the per model override in LLM_MODEL_CONCURRENCY); the time spent waiting,
+    the call latency and the calls in flight are kept per model.
+    Every call runs on the async client, on a dedicated event loop thread owned by the gateway: the
+    async http client and the slots are bound to that loop, while callers use any loop (streamlit
+    runs each click in a fresh asyncio.run) or none at all through the blocking generate_content.
+    Agents listed in LLM_CACHE_AGENTS are answered from the persistent response cache when the same
+    model, config and prompt were seen before; a hit takes no concurrency slot and makes no call.
+    """
+    def __init__(self):
+        self.config = Config()
+        limits = httpx.Limits(
+            max_connections=self.config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=self.config.LLM_HTTP_MAX_CONNECTIONS,
+        )
+        construct_start = time.perf_counter()
+        self.client = genai.Client(
+            vertexai=True,
+            project=self.config.PROJECT_ID,
+            location=self.config.LOCATION,
+            http_options=HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits}),
+        )
+        self.construct_seconds = time.perf_counter() - construct_start
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        # created on the gateway loop only
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.stats: Dict[str, Dict] = {}
+        self.cache = None
+        if self.config.LLM_CACHE_ENABLED:
+            self.cache = LLMResponseCache(
+                self.config.LLM_CACHE_PATH,
+                ttl=self.config.LLM_CACHE_TTL_SECONDS,
+                max_entries=self.config.LLM_CACHE_MAX_ENTRIES,
+            )
+
+    # ---- event loop thread ----
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._thread_lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coro: Awaitable[T]):
+        """Schedule a coroutine on the gateway loop, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    # ---- limits ----
+    def concurrency(self, model: str) -> int:
+        """Concurrent calls allowed for a model"""
+        overrides = {}
+        for item in self.config.LLM_MODEL_CONCURRENCY.split(","):
+            name, _, limit = item.partition("=")
+            if name.strip() and limit.strip():
+                overrides[name.strip()] = int(limit)
+        return overrides.get(model, self.config.LLM_MAX_CONCURRENCY)
+
+    def cache_agents(self) -> set:
+        """Agents whose calls use the response cache by default"""
+        return {agent.strip() for agent in self.config.LLM_CACHE_AGENTS.split(",") if agent.strip()}
+
+    def _use_cache(self, agent: Optional[str], cache: Optional[bool]) -> bool:
+        if self.cache is None:
+            return False
+        return (agent in self.cache_agents()) if cache is None else cache
+
+    def _model(self, model: str):
+        """(slots, stats) of a model, created on its first call (gateway loop only)"""
+        with self._lock:
+            if model not in self._slots:
+                self._slots[model] = asyncio.Semaphore(self.concurrency(model))
+                self.stats[model] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "in_flight": 0,
+                    "max_in_flight": 0,
+                    "queued": 0,  # calls waiting for a slot right now
+                    "latency_seconds_total": 0.0,
+                    "queue_seconds_total": 0.0,
+                    "max_queue_seconds": 0.0,
+                    "last_latency_seconds": None,
+                    "streams": 0,
+                    "ttft_seconds_total": 0.0,  # time to the first streamed chunk
+                    "last_ttft_seconds": None,
+                    "by_agent": {},
+                }
+            return self._slots[model], self.stats[model]
+
+    def _begin(self, stats: Dict, queued_at: float, agent: Optional[str]) -> float:
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            stats["queued"] -= 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            stats["queue_seconds_total"] += waited
+            stats["max_queue_seconds"] = max(stats["max_queue_seconds"], waited)
+            if agent:
+                stats["by_agent"][agent] = stats["by_agent"].get(agent, 0) + 1
+        return time.perf_counter()
+
+    def _end(self, stats: Dict, started: float, failed: bool, ttft: Optional[float] = None):
+        latency = time.perf_counter() - started
+        with self._lock:
+            stats["in_flight"] -= 1
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["latency_seconds_total"] += latency
+            stats["last_latency_seconds"] = latency
+            if ttft is not None:
+                stats["streams"] += 1
+                stats["ttft_seconds_total"] += ttft
+                stats["last_ttft_seconds"] = ttft
+
+    # ---- calls ----
+    async def _generate(self, model: str, contents, config, agent: Optional[str],
+                        cache: Optional[bool], refresh: bool):
+        # gateway loop only
+        use_cache = self._use_cache(agent, cache)
+        if use_cache:
+            key = response_key(model, contents, config)
+            cached = None if refresh or self.config.LLM_CACHE_REFRESH else self.cache.get(key, agent)
+            if cached is not None:
+                return GenerateContentResponse.model_validate_json(cached)
+        slots, stats = self._model(model)
+        queued_at = time.perf_counter()
+        with self._lock:
+            stats["queued"] += 1
+        async with slots:
+            started = self._begin(stats, queued_at, agent)
+            failed = True
+            try:
+                response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+                failed = False
+            finally:
+                self._end(stats, started, failed)
+        # empty (blocked or cut off) answers are not kept
+        if use_cache and response.text:
+            self.cache.put(key, model, response.model_dump_json(exclude_none=True),
+                           time.perf_counter() - started, agent)
+        return response
+
+    async def _stream(self, model: str, contents, config, agent: Optional[str],
+                      cache: Optional[bool], refresh: bool, emit: Callable[[str], None]) -> str:
+        # gateway loop only, emit is called with each text chunk and must be thread safe
+        use_cache = self._use_cache(agent, cache)
+        if use_cache:
+            key = response_key(model, contents, config)
+            cached = None if refresh or self.config.LLM_CACHE_REFRESH else self.cache.get(key, agent)
+            if cached is not None:
+                text = GenerateContentResponse.model_validate_json(cached).text or ""
+                emit(text)
+                return text
+        slots, stats = self._model(model)
+        queued_at = time.perf_counter()
+        with self._lock:
+            stats["queued"] += 1
+        parts, ttft = [], None
+        async with slots:
+            started = self._begin(stats, queued_at, agent)
+            failed = True
+            try:
+                async for chunk in await self.client.aio.models.generate_content_stream(
+                    model=model, contents=contents, config=config
+                ):
+                    if chunk.text:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(chunk.text)
+                        emit(chunk.text)
+                failed = False
+            finally:
+                self._end(stats, started, failed, ttft)
+        text = "".join(parts)
+        if use_cache and text:
+            # stored like a generate_content response, a later non streamed call hits it too
+            response = GenerateContentResponse(candidates=[Candidate(content=Content(role="model", parts=[Part(text=text)]))])
+            self.cache.put(key, model, response.model_dump_json(exclude_none=True),
+                           time.perf_counter() - started, agent)
+        return text
+
+    async def astream_content(self, model: str, contents, config=None, agent: Optional[str] = None,
+                              cache: Optional[bool] = None, refresh: bool = False) -> AsyncIterator[str]:
+        """
+        generate_content_stream through the model's concurrency limit, yields the text chunks as they
+        arrive, awaitable from any event loop. A cached response comes as a single chunk.
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        emit = lambda text: loop.call_soon_threadsafe(chunks.put_nowait, text)
+        future = asyncio.wrap_future(self.submit(self._stream(model, contents, config, agent, cache, refresh, emit)))
+        # scheduled after every emitted chunk, the loop keeps the order
+        future.add_done_callback(lambda _: chunks.put_nowait(_END))
+        try:
+            while (text := await chunks.get()) is not _END:
+                yield text
+            await future
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stream_content(self, model: str, contents, config=None, agent: Optional[str] = None,
+                       cache: Optional[bool] = None, refresh: bool = False) -> Iterator[str]:
+        """Blocking astream_content, yields the text chunks as they arrive"""
+        chunks: queue.Queue = queue.Queue()
+        future = self.submit(self._stream(model, contents, config, agent, cache, refresh, chunks.put))
+        future.add_done_callback(lambda _: chunks.put(_END))
+        try:
+            while (text := chunks.get()) is not _END:
+                yield text
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def agenerate_content(self, model: str, contents, config=None, agent: Optional[str] = None,
+                                cache: Optional[bool] = None, refresh: bool = False):
+        """
+        generate_content through the model's concurrency limit, awaitable from any event loop.
+        cache overrides the agent's LLM_CACHE_AGENTS opt-in (False bypasses the cache),
+        refresh makes the call even on a cached prompt and replaces the cached response.
+        """
+        return await asyncio.wrap_future(self.submit(self._generate(model, contents, config, agent, cache, refresh)))
+
+    def generate_content(self, model: str, contents, config=None, agent: Optional[str] = None,
+                         cache: Optional[bool] = None, refresh: bool = False):
+        """Blocking generate_content through the model's concurrency limit, same cache switches"""
+        return self.submit(self._generate(model, contents, config, agent, cache, refresh)).result()
+
+    def report(self) -> Dict:
+        """Per model calls, average latency and queue wait, and calls in flight"""
+        with self._lock:
+            report = {"construct_seconds": round(self.construct_seconds, 3), "models": {}}
+            for model, stats in self.stats.items():
+                calls = stats["calls"]
+                report["models"][model] = {
+                    **stats,
+                    "by_agent": dict(stats["by_agent"]),
+                    "concurrency": self.concurrency(model),
+                    "avg_latency_seconds": round(stats["latency_seconds_total"] / calls, 3) if calls else None,
+                    "avg_queue_seconds": round(stats["queue_seconds_total"] / calls, 4) if calls else None,
+                    "avg_ttft_seconds": round(stats["ttft_seconds_total"] / stats["streams"], 3) if stats["streams"] else None,
+                }
+        report["cache"] = self.cache.report() if self.cache is not None else None
+        return report
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Process wide LLM gateway used by every agent"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
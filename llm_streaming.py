@@ -0,0 +1,67 @@
+# llm_streaming.py
+# agent output streamed into langgraph's custom stream mode as it is generated, with time to first token and total time
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, Tuple
+from langgraph.config import get_stream_writer
+
+
+def stream_writer() -> Callable[[Dict], None]:
+    """The running graph's custom stream writer, a no-op when the agent is called outside a graph"""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
+
+
+class StreamTimer:
+    """
+    Collects the chunks of one streamed generation and sends every update to the stream as
+    {"agent", "text" (everything so far), "chunk", "done", "ttft_seconds", "total_seconds"}
+    """
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.write = stream_writer()
+        self.parts = []
+        self.started = time.perf_counter()
+        self.ttft = None
+
+    def add(self, chunk: str):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+        self.parts.append(chunk)
+        self.write({"agent": self.agent, "text": self.text, "chunk": chunk, "done": False})
+
+    def finish(self) -> Tuple[str, Dict]:
+        timings = {
+            "ttft_seconds": round(self.ttft, 3) if self.ttft is not None else None,
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+        }
+        self.write({"agent": self.agent, "text": self.text, "chunk": "", "done": True, **timings})
+        return self.text, timings
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+def collect_stream(chunks: Iterator[str], agent: str) -> Tuple[str, Dict]:
+    """(full text, timings) of a gateway stream_content, streaming it on the way"""
+    timer = StreamTimer(agent)
+    for chunk in chunks:
+        timer.add(chunk)
+    return timer.finish()
+
+
+async def acollect_stream(chunks: AsyncIterator[str], agent: str) -> Tuple[str, Dict]:
+    """(full text, timings) of a gateway astream_content, streaming it on the way"""
+    timer = StreamTimer(agent)
+    async for chunk in chunks:
+        timer.add(chunk)
+    return timer.finish()
+
+
+def with_timings(state: Dict, agent: str, timings: Dict) -> Dict:
+    """The state's metadata with the agent's latest timings added"""
+    metadata = dict(state.get("metadata") or {})
+    metadata["timings"] = {**metadata.get("timings", {}), agent: timings}
+    return metadata
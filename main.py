@@ -3,8 +3,10 @@
 import asyncio
 import streamlit as st
 import os
+import time
 
-from chroma_manager import ChromaManager
+from chroma_manager import get_chroma_manager
+from llm_gateway import get_llm_gateway
 from book_workflow import BookPublicationWorkflow
 
 from utils.config import Config
@@ -12,6 +14,7 @@ from PIL import Image
 import json
 from utils.config import Config, WorkflowState
 from scraper import ContentScraper
+from crawler import BookCrawler
 import uuid
 from langgraph.types import Command
 
@@ -42,7 +45,8 @@ if "thread_id" not in st.session_state:
 if "storage" not in st.session_state:
     # stores the storage object used to store the content and version control and all utility functions
     # stores chroma manager object to manage the content storage and retrieval
-    st.session_state.storage = ChromaManager()
+    # the manager is shared by the whole process, a new session does not download the snapshot again
+    st.session_state.storage = get_chroma_manager()
 
 # Initialize a new thread ID for a fresh start
 if not st.session_state.thread_id:
@@ -61,6 +65,18 @@ def main():
         ["Workflow", "Content Management", "Search & Retrieval"]
     )
     
+    # calls of every session go through the one process wide gateway
+    for model, stats in get_llm_gateway().report()["models"].items():
+        st.sidebar.caption(f"{model}: {stats['in_flight']}/{stats['concurrency']} in flight, {stats['queued']} queued, "
+                           f"{stats['calls']} calls, avg {stats['avg_latency_seconds'] or 0:.2f}s "
+                           f"(queue {stats['avg_queue_seconds'] or 0:.3f}s)"
+                           + (f", first token {stats['avg_ttft_seconds']:.2f}s" if stats['avg_ttft_seconds'] is not None else ""))
+    cache = get_llm_gateway().report()["cache"]
+    if cache:
+        for agent, stats in cache["agents"].items():
+            st.sidebar.caption(f"LLM cache {agent}: {stats['hits']} hits / {stats['misses']} misses "
+                               f"(hit rate {stats['hit_rate'] or 0:.0%}), {stats['saved_seconds']:.1f}s saved")
+
     if page == "Workflow":
         workflow_page()
     elif page == "Content Management":
@@ -77,6 +93,42 @@ async def scrape_and_process_content(scraper: ContentScraper, initial_state: Wor
 
 
 # --- Helper Function to Get Current Workflow State from Checkpointer ---
+# agent stream chunks -> tab showing them while the graph runs
+STREAM_TABS = {"writer": "🌀 Spun Content", "reviewer": "🧐 Review", "quality": "✅ Quality Report"}
+
+
+def timings_caption(timings: dict) -> str:
+    return f"first token {timings['ttft_seconds'] or 0:.2f}s, total {timings['total_seconds']:.2f}s"
+
+
+def run_workflow(payload) -> WorkflowState:
+    """
+    Run (or resume, payload being a Command) the session's workflow thread through astream,
+    writing the agents' output into live tabs as it is generated. Returns the last graph state.
+    """
+    tabs = dict(zip(STREAM_TABS, st.tabs(list(STREAM_TABS.values()))))
+    panels = {}
+    for agent, tab in tabs.items():
+        with tab:
+            panels[agent] = (st.empty(), st.empty())
+
+    async def consume():
+        result = None
+        async for mode, chunk in st.session_state.workflow.astream(
+            payload, st.session_state.thread_id, stream_mode=["custom", "values"]
+        ):
+            if mode == "values":
+                result = chunk
+            elif chunk.get("agent") in panels:
+                text_panel, caption_panel = panels[chunk["agent"]]
+                text_panel.markdown(chunk["text"])
+                if chunk["done"]:
+                    caption_panel.caption(timings_caption(chunk))
+        return result
+
+    return asyncio.run(consume())
+
+
 def get_current_workflow_state() -> WorkflowState:
     """Retrieves the current state of the LangGraph workflow from the checkpointer."""
     if st.session_state.thread_id:
@@ -106,7 +158,7 @@ def workflow_page():
     )
 
     # Start the workflow
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
 
     with col1:
         if st.button("Start workflow", type="primary"):
@@ -162,9 +214,9 @@ def workflow_page():
                             # if st.session_state.current_state: 
                             #     display_workflow_state()
                             #print(st.session_state.current_state)
-                            result = st.session_state.workflow.app.invoke(
-                                st.session_state.current_state,
-                                config={"configurable": {"thread_id": st.session_state.thread_id}})
+                            # async agent nodes, the llm calls are awaited instead of holding this script thread,
+                            # their output is shown as it streams in
+                            result = run_workflow(st.session_state.current_state)
                             
                             print(f"Workflow result: {result.get('status', 'unknown')}")
 
@@ -182,6 +234,20 @@ def workflow_page():
                     st.error("Failed to scrape content, Failed to start the workflow.")
                     return
 
+    with col3:
+        if st.button("📖 Crawl Whole Book"):
+            if url:
+                with st.spinner("Crawling chapters..."):
+                    # as streamlit doesnt support async function call we need to use asyncio.run() to run the async function
+                    manifest = asyncio.run(BookCrawler(url).crawl())
+
+                st.success(f"Crawled {manifest['chapter_count']} chapters in {manifest['elapsed_seconds']}s "
+                           f"({manifest['failed']} failed), manifest saved at {manifest['manifest_path']}")
+                st.json([
+                    {key: chapter.get(key) for key in ("chapter_number", "title", "url", "status")}
+                    for chapter in manifest["chapters"]
+                ])
+
     with col2:
         if st.button("🔄 Reset Workflow"):
             st.session_state.current_state = None
@@ -222,11 +288,17 @@ def display_workflow_state():
     with tabs[0]:
         st.write(state.get('original_content',"No original content available."))
             
+    timings = (state.get('metadata') or {}).get('timings', {})
+
     with tabs[1]:
        st.write(state.get('current_content',"No spun content available."))
+       if 'writer' in timings:
+           st.caption(timings_caption(timings['writer']))
          
     with tabs[2]:
         st.write(state.get('reviewer_feedback',"No reviewer feedback available."))
+        if 'reviewer' in timings:
+            st.caption(timings_caption(timings['reviewer']))
 
     with tabs[3]:
         st.write(state.get('manager_decision',"No manager decision available."))
@@ -279,8 +351,7 @@ def display_workflow_state():
                         values = st.session_state.workflow_state)
                     
                     # resume the workflow
-                    result = st.session_state.workflow.app.invoke(Command(resume=f"Feedback: {st.session_state.workflow_state['human_feedback']}"),
-                                                                config={"configurable": {"thread_id": st.session_state.thread_id}})
+                    result = run_workflow(Command(resume=f"Feedback: {st.session_state.workflow_state['human_feedback']}"))
                     # result = st.session_state.workflow.app.invoke(st.session_state.workflow_state,
                     #                                             config={"configurable": {"thread_id": st.session_state.thread_id}})
                     st.session_state.workflow_state = result 
@@ -303,8 +374,7 @@ def display_workflow_state():
                     )
 
                     # resume the workflow
-                    result = st.session_state.workflow.app.invoke(Command(resume=f"Feedback for rejection: {st.session_state.workflow_state['human_feedback']}"),
-                                                                    config={"configurable": {"thread_id": st.session_state.thread_id}})
+                    result = run_workflow(Command(resume=f"Feedback for rejection: {st.session_state.workflow_state['human_feedback']}"))
                     
                     st.session_state.workflow_state = result 
                     print(f"Finalized result: {st.session_state.workflow.app.state.get('quality_report', 'unknown')}")
@@ -330,8 +400,7 @@ def display_workflow_state():
                     )
 
                     # resume the workflow
-                    result = st.session_state.workflow.app.invoke(Command(resume=f"Feedback for revision: {st.session_state.workflow_state['human_feedback']}"),
-                                                                    config={"configurable": {"thread_id": st.session_state.thread_id}})
+                    result = run_workflow(Command(resume=f"Feedback for revision: {st.session_state.workflow_state['human_feedback']}"))
                     
                     st.session_state.workflow_state = result 
 
@@ -349,26 +418,67 @@ def content_management_page():
     # Get all stored content
     storage = st.session_state.storage
 
+    startup = storage.startup_report()
+    if startup["ready"]:
+        st.caption(f"Storage ready in {startup['init_seconds']:.2f}s "
+                   f"(GCS download {startup['gcs_download_seconds']:.2f}s, peak RSS {startup['peak_rss_mb_after']:.0f}MB), "
+                   f"module import {startup['import_seconds'] * 1000:.0f}ms, construction {startup['construct_seconds'] * 1000:.1f}ms")
+    else:
+        st.caption("Storage is warming up in the background...")
+    writes = storage.write_report()
+    if writes:
+        st.caption(f"Write queue: {writes['queue_depth']} pending, last batch {writes['last_batch_size']} "
+                   f"documents in {writes['last_flush_seconds'] or 0:.3f}s, {writes['documents_flushed']} flushed")
+
+    if storage.config.CHROMA_DELTA_VERSIONS:
+        for chapter in storage.delta_report():
+            st.caption(f"{chapter['chapter_id']}: {chapter['versions']} versions, {chapter['stored_bytes']} bytes stored "
+                       f"instead of {chapter['full_bytes']} as full copies ({chapter['ratio'] or 0:.0%})")
+
+    # embeddings are computed again in the background, in worker processes when CHROMA_EMBED_PROCESSES is set
+    if st.button("🔁 Re-index embeddings"):
+        try:
+            storage.reindex()
+        except RuntimeError as e:
+            st.info(str(e))
+    progress = storage.reindex_progress
+    if progress:
+        st.caption(f"Re-index {progress['status']}: {progress['documents']} documents and {progress['passages']} passages "
+                   f"in {progress['seconds']}s ({progress['documents_per_second'] or 0} documents/s)")
+
     st.subheader("Stored Content")
 
-    # simple query to get all documents
+    # metadata only listing from the document index, nothing is embedded to enumerate documents
     try:
-        # get all documents by querying with generic term
-        all_content = storage.search_content("content", n_results=50)
-
-        if all_content:
-            for i,item in enumerate(all_content):
-                if isinstance(item,dict):
-                    with st.expander(f"Document {i+1} - {item['results'].get('type','unknown')}"):
-                        # this means 2 rows and 1 column
-                        col1, col2 = st.columns([2,1])
-
-                        with col1:
-                            st.text_area(f"Content {i+1}",item['content'][:500]+ "...")
-
-                        with col2:
-                            # in this db results = metadata
-                            st.json(item['results'])
+        filter_col, sort_col, size_col = st.columns(3)
+        with filter_col:
+            doc_type = st.selectbox("Type", ["all"] + storage.content_types())
+        with sort_col:
+            sort = st.selectbox("Sort by", ["timestamp", "iteration", "type", "version_number"])
+            descending = st.checkbox("Newest / highest first", value=True)
+        with size_col:
+            page_size = st.selectbox("Per page", [20, 50, 100])
+
+        doc_type = None if doc_type == "all" else doc_type
+        total = storage.list_content(limit=0, doc_type=doc_type)["total"]
+        pages = max(1, (total + page_size - 1) // page_size)
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+        listing = storage.list_content(limit=page_size, offset=(page - 1) * page_size, doc_type=doc_type,
+                                       sort=sort, descending=descending)
+
+        if listing["items"]:
+            st.caption(f"{listing['total']} documents")
+            for i, item in enumerate(listing["items"], start=(page - 1) * page_size):
+                metadata = item["metadata"]
+                with st.expander(f"Document {i+1} - {metadata.get('type','unknown')} - {metadata.get('timestamp', '')}"):
+                    # this means 2 rows and 1 column
+                    col1, col2 = st.columns([2,1])
+
+                    with col1:
+                        st.text_area(f"Content {i+1}", item['preview'] + "...")
+
+                    with col2:
+                        st.json(metadata)
 
         else:
             st.info("No content stored yet. Run the workflow to generate content.")
@@ -388,7 +498,13 @@ def search_retrieval_page():
         storage = st.session_state.storage
 
         with st.spinner("Searching..."):
+            search_start = time.perf_counter()
             results = storage.search_content(search_query, n_results = 10)
+            search_ms = (time.perf_counter() - search_start) * 1000
+
+        cache = storage.search_report()
+        st.caption(f"Search took {search_ms:.2f}ms, result cache hit rate {cache['hit_rate'] or 0:.0%} "
+                   f"({cache['hits']} hits / {cache['misses']} misses, {cache['entries']} cached)")
 
         if results:
             st.subheader(f"Found {len(results)} results")
@@ -396,7 +512,12 @@ def search_retrieval_page():
             #print(f"Results: {type(results)}")
             for i, result in enumerate(results):
                 if isinstance(result, dict):
-                    with st.expander(f"Result {i+1} (Distance: {result['distance']:.3f})"):
+                    # passage results carry a fused score, keyword only hits have no distance
+                    if 'score' in result:
+                        label = f"Result {i+1} (Score: {result['score']:.4f}, passage at offset {result['results'].get('offset', 0)})"
+                    else:
+                        label = f"Result {i+1} (Distance: {result['distance']:.3f})"
+                    with st.expander(label):
                         st.text_area(f"Content ", result['content'][:1000] + "...", height=200, disabled=True)
                         print(f"Keys {result.keys()}")
                         # in the chromamanager class result is the metadata
@@ -407,10 +528,10 @@ def search_retrieval_page():
         # Recent content
         st.subheader("📅 recent Content")
         try:
-            recent_content = st.session_state.storage.search_content("recent", n_results=5)
+            recent_content = st.session_state.storage.list_content(limit=5)["items"]
             for i, result in enumerate(recent_content):
                 with st.expander(f"Recent {i+1} - {result['metadata'].get('timestamp', 'Unknow time')}"):
-                    st.text(result['content'][:300]+"...")
+                    st.text(result['preview']+"...")
         except Exception as e:
             st.info("No recent content available.")
 
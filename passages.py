@@ -0,0 +1,92 @@
+# passages.py
+# passage level indexing of stored chapters: paragraph windows, a sqlite FTS5 keyword index and rank fusion
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+PARAGRAPH_PATTERN = re.compile(r"[^\n]+")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def split_passages(text: str, max_chars: int = 1000, overlap: int = 1) -> List[Tuple[int, str]]:
+    """
+    (character offset, passage text) windows of consecutive paragraphs, each about max_chars long.
+    A window repeats the last overlap paragraphs of the previous one, so a sentence pair spanning
+    a window boundary is still found in one passage. A paragraph longer than max_chars is cut on whitespace.
+    """
+    paragraphs: List[Tuple[int, int]] = []
+    for match in PARAGRAPH_PATTERN.finditer(text):
+        if not match.group().strip():
+            continue
+        start, end = match.span()
+        while end - start > max_chars:
+            cut = text.rfind(" ", start, start + max_chars)
+            cut = cut if cut > start else start + max_chars
+            paragraphs.append((start, cut))
+            start = cut + 1
+        paragraphs.append((start, end))
+
+    passages, first = [], 0
+    while first < len(paragraphs):
+        last = first
+        while last + 1 < len(paragraphs) and paragraphs[last + 1][1] - paragraphs[first][0] <= max_chars:
+            last += 1
+        start, end = paragraphs[first][0], paragraphs[last][1]
+        passages.append((start, text[start:end]))
+        if last + 1 >= len(paragraphs):
+            break
+        # step back overlap paragraphs, always moving forward by at least one
+        first = max(last + 1 - overlap, first + 1)
+    return passages
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of ranked id lists, (id, score) best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class KeywordIndex:
+    """
+    Full text index of the passages in a sqlite FTS5 table, ranked by bm25.
+    Queries are reduced to their words and OR-ed, so user input never hits the FTS5 query syntax.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+            "passage_id UNINDEXED, doc_id UNINDEXED, text, tokenize = 'porter unicode61')"
+        )
+        self._db.commit()
+
+    def add(self, passage_ids: List[str], doc_ids: List[str], texts: List[str]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO passages (passage_id, doc_id, text) VALUES (?, ?, ?)",
+                zip(passage_ids, doc_ids, texts),
+            )
+            self._db.commit()
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """(passage_id, bm25 score) best first, lower bm25 is better in sqlite"""
+        words = WORD_PATTERN.findall(query)
+        if not words:
+            return []
+        match = " OR ".join(f'"{word}"' for word in dict.fromkeys(word.lower() for word in words))
+        with self._lock:
+            return self._db.execute(
+                "SELECT passage_id, bm25(passages) AS score FROM passages WHERE passages MATCH ? "
+                "ORDER BY score LIMIT ?",
+                (match, limit),
+            ).fetchall()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+
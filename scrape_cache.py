@@ -0,0 +1,147 @@
+# scrape_cache.py
+# on disk scrape cache keyed by url, turns repeat scrapes of an unchanged page into a cache hit or a revalidation
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from utils.config import Config
+from scrape_store import get_scrape_store
+
+logger = logging.getLogger(__name__)
+
+
+class ScrapeCache:
+    """
+    Url -> last scrape index. Each entry keeps the http validators (ETag, Last-Modified)
+    and the hash of the cleaned text of the record saved in the scrape store.
+    Within the ttl a repeat scrape is served from the record without any request, after the ttl
+    the page is revalidated with a conditional GET, and a page whose cleaned text hashes the same
+    reuses the existing record instead of writing new files.
+    The index is bounded to max_entries, least recently used entries are evicted first.
+    """
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.config = Config()
+        self.path = path or self.config.SCRAPE_CACHE_PATH
+        self.ttl = self.config.SCRAPE_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.max_entries = max_entries or self.config.SCRAPE_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = self._load()
+
+        self.stats = {
+            "hits": 0,         # served within the ttl, no request made
+            "revalidated": 0,  # server answered 304 not modified
+            "unchanged": 0,    # page fetched again but the cleaned text hash matched
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    # ---- index file ----
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Scrape cache index at {self.path} is unreadable, starting empty: {e}")
+            return {}
+
+    def _flush(self):
+        # write to a temp file and swap it in, so a crash never leaves a half written index
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._entries, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # ---- helpers ----
+    @staticmethod
+    def validators(response) -> Dict:
+        """ETag and Last-Modified of an http response"""
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict:
+        """If-None-Match / If-Modified-Since headers for revalidating a cached entry"""
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def fresh(self, entry: Dict) -> bool:
+        return time.time() - entry.get('validated_at', 0) < self.ttl
+
+    # ---- lookups and updates ----
+    def get(self, url: str, chapter_number: int) -> Optional[Tuple[Dict, Dict]]:
+        """(entry, saved record) for the url, None when not cached or the record is gone from the store"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry.get('chapter_number') != chapter_number:
+                return None
+            record = get_scrape_store().latest(url=url)
+            if record is None or record['content_hash'] != entry.get('content_hash'):
+                # the stored record was removed or replaced, forget the entry
+                del self._entries[url]
+                self._flush()
+                return None
+            entry['last_used'] = time.time()
+            return dict(entry), record
+
+    def touch(self, url: str, validators: Optional[Dict] = None):
+        """Mark a cached entry as validated now, keeping newer validators when the server sent any"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return
+            for key, value in (validators or {}).items():
+                if value:
+                    entry[key] = value
+            entry['validated_at'] = entry['last_used'] = time.time()
+            self._flush()
+
+    def put(self, url: str, chapter_number: int, content_hash: str, validators: Optional[Dict] = None):
+        """Index the record just saved for the url"""
+        now = time.time()
+        with self._lock:
+            self._entries[url] = {
+                'chapter_number': chapter_number,
+                'content_hash': content_hash,
+                'etag': (validators or {}).get('etag'),
+                'last_modified': (validators or {}).get('last_modified'),
+                'validated_at': now,
+                'last_used': now,
+            }
+            self._evict()
+            self._flush()
+
+    def _evict(self):
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = sorted(self._entries, key=lambda url: self._entries[url].get('last_used', 0))[:overflow]
+        for url in oldest:
+            del self._entries[url]
+        self.stats["evictions"] += overflow
+
+
+_cache: Optional[ScrapeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_scrape_cache() -> ScrapeCache:
+    """Process wide scrape cache used by every ContentScraper"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ScrapeCache()
+        return _cache
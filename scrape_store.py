@@ -0,0 +1,165 @@
+# scrape_store.py
+# content addressed store of scraped chapters with an append only manifest index
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+from utils.config import Config
+from version_index import chapter_ref
+
+logger = logging.getLogger(__name__)
+
+
+class ScrapeStore:
+    """
+    Scraped chapter texts are stored once per distinct cleaned text, gzip compressed under
+    objects/<hash[:2]>/<hash>.txt.gz. Every scrape appends one line (url, chapter number, title,
+    timestamp, content hash and fetch info) to manifest.jsonl. The manifest is read once at start up
+    into latest-by-url and latest-by-chapter indexes, so lookups never list or parse the directory.
+    Chapter numbers restart in every book or part, so chapters are indexed per (book, chapter number),
+    the book being the parent path of the chapter url (version_index.chapter_ref).
+    """
+    def __init__(self, root: Optional[str] = None):
+        self.config = Config()
+        self.root = root or self.config.SCRAPE_STORE_PATH
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifest_path = os.path.join(self.root, "manifest.jsonl")
+        self._lock = threading.Lock()
+        self._latest_by_url: Dict[str, Dict] = {}
+        self._latest_by_chapter: Dict[Tuple[str, int], Dict] = {}
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        is_new = not os.path.exists(self.manifest_path)
+        self._load_manifest()
+        if is_new:
+            # one time migration of the chapter_<n>_<timestamp>.json dumps written before the store existed
+            self.import_legacy_records(os.path.join(os.path.dirname(self.root) or ".", "chapter_*.json"))
+
+    # ---- manifest ----
+    def _load_manifest(self):
+        for entry in self.entries():
+            self._index(entry)
+
+    def _index(self, entry: Dict):
+        self._latest_by_url[entry['url']] = entry
+        self._latest_by_chapter[(chapter_ref(entry['url'])['book'], entry['chapter_number'])] = entry
+
+    def _append(self, entry: Dict):
+        with open(self.manifest_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._index(entry)
+
+    def entries(self) -> Iterator[Dict]:
+        """Every manifest entry in the order it was written"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # a torn last line after a crash, skip it
+                        logger.warning(f"Skipping unreadable manifest line in {self.manifest_path}")
+        except FileNotFoundError:
+            return
+
+    # ---- objects ----
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self.objects_dir, content_hash[:2], f"{content_hash}.txt.gz")
+
+    def _write_object(self, content_hash: str, text: str):
+        path = self._object_path(content_hash)
+        # identical scrapes share one object
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+
+    def read_content(self, content_hash: str) -> Optional[str]:
+        try:
+            with gzip.open(self._object_path(content_hash), 'rt', encoding='utf-8') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    # ---- records ----
+    def put(self, record: Dict) -> Dict:
+        """Store a content record, returns its manifest entry (the record without the text, plus content_hash)"""
+        entry = {key: value for key, value in record.items() if key != 'content'}
+        entry['content_hash'] = record.get('content_hash') or self.content_hash(record['content'])
+        with self._lock:
+            self._write_object(entry['content_hash'], record['content'])
+            self._append(entry)
+        return entry
+
+    def update(self, url: str, **fields) -> Optional[Dict]:
+        """Append a copy of the latest entry of the url with some fields changed (e.g. a late screenshot_path)"""
+        with self._lock:
+            latest = self._latest_by_url.get(url)
+            if latest is None:
+                return None
+            entry = {**latest, **fields}
+            self._append(entry)
+        return entry
+
+    def _record(self, entry: Optional[Dict]) -> Optional[Dict]:
+        if entry is None:
+            return None
+        content = self.read_content(entry['content_hash'])
+        if content is None:
+            return None
+        return {**entry, 'content': content}
+
+    def latest(self, url: Optional[str] = None, chapter_number: Optional[int] = None,
+               book: Optional[str] = None) -> Optional[Dict]:
+        """Latest full record for a url, or for a chapter number of a book (the book of the default url if not given)"""
+        if url is not None:
+            return self._record(self._latest_by_url.get(url))
+        book = book if book is not None else chapter_ref(self.config.DEFAULT_URL)['book']
+        return self._record(self._latest_by_chapter.get((book, chapter_number)))
+
+    def latest_entry(self, url: str) -> Optional[Dict]:
+        """Latest manifest entry of a url, without reading the text"""
+        return self._latest_by_url.get(url)
+
+    def import_legacy_records(self, pattern: str) -> int:
+        """Add old per scrape json dumps to the store, returns how many were imported"""
+        imported = 0
+        for path in sorted(glob.glob(pattern)):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    record = json.load(file)
+                # the oldest dumps carry the chapter number only in the file name
+                record.setdefault('chapter_number', int(os.path.basename(path).split("_")[1]))
+                self.put(record)
+                imported += 1
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not import {path} into the scrape store: {e}")
+        if imported:
+            logger.info(f"Imported {imported} legacy scrape records into {self.root}")
+        return imported
+
+
+_store: Optional[ScrapeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_scrape_store() -> ScrapeStore:
+    """Process wide scrape store used by every ContentScraper"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ScrapeStore()
+        return _store
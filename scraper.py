@@ -1,13 +1,28 @@
 import asyncio
 import os
 from datetime import datetime
-# it is used to scrap async data using the playwright library
-from playwright.async_api import async_playwright
-# it is used to parse the html data(beautifulsoup used to parse the web scrap data)
-from bs4 import BeautifulSoup
-import json 
-import re
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from utils.config import Config, WorkflowState
+# pooled playwright browser, used to scrap async data without launching chromium per scrape
+from browser_pool import get_browser_pool
+# keep-alive http client for the fast path on static pages
+from http_fetch import get_http_fetcher
+# url keyed cache of previous scrapes, repeat scrapes of an unchanged page reuse the saved record
+from scrape_cache import ScrapeCache, get_scrape_cache
+# content addressed store of the scraped records with a manifest index
+from scrape_store import ScrapeStore, get_scrape_store
+# optional page screenshots, captured in the background once the text is returned
+from screenshots import ScreenshotCapture
+# targeted content container extraction and one pass paragraph normalizer
+from extraction import CONTAINER_SCRIPT, extract_paragraphs, normalize_paragraphs
+
+# resource types the text scrape never needs, aborted by the request policy
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
 
 
 class ContentScraper:
@@ -15,6 +30,16 @@ class ContentScraper:
         self.base_url = base_url
         self.screenshots_dir = "screenshots"
         self.content_dir = "content"
+        self.config = Config()
+        self.browser_pool = get_browser_pool()
+        self.http = get_http_fetcher()
+        self.store = get_scrape_store()
+        self.cache = get_scrape_cache() if self.config.SCRAPE_CACHE_ENABLED else None
+        # per url fetch path ("cache", "revalidated", "http", "mediawiki_api" or "playwright") and latency
+        self.fetch_log: Dict[str, Dict] = {}
+        self.screenshots = ScreenshotCapture(self.screenshots_dir) if self.config.SCREENSHOT_ENABLED else None
+        # url -> pending background screenshot (concurrent.futures.Future of the image paths)
+        self.screenshot_jobs: Dict[str, Future] = {}
 
     # asynq keyword in python referes to the function can run asynqronously
     # with other fns
@@ -27,88 +52,244 @@ class ContentScraper:
     def clean_text(self, text: str) -> str:
         """
         Remove HTML navigation artifacts like arrows, layout, and footnotes.
+        Line breaks are kept as paragraph breaks.
         """
-        # Remove arrows and navigation cues
-        text = re.sub(r"[←→]", "", text)
-        
-        # Remove layout references like "Layout 2"
-        text = re.sub(r"Layout\s*\d+", "", text)
+        return "\n\n".join(normalize_paragraphs(text.split("\n")))
 
-        # Remove footnote references like [1], [2], etc.
-        text = re.sub(r"\[\d+\]", "", text)
+    async def scrape_content(self, state: WorkflowState) -> WorkflowState:
+        """Scrape content, the screenshot (when enabled) follows in the background"""
+        content_data = await self.scrape_chapter()
 
-        # Remove excessive whitespace
-        text = re.sub(r"\s{2,}", " ", text).strip()
+        if content_data is None:
+            return None
 
-        text_content = re.sub(r"\[\s*\d+\s*\]", "", text)
+        return {
+            **state,
+            'original_content': content_data,
+            'current_content': content_data,
+            'status': 'scraped',
+        }
 
-        return text_content 
+    async def scrape_chapter(self, url: Optional[str] = None, chapter_number: int = 1,
+                             title: Optional[str] = None) -> Optional[Dict]:
+        """Scrape a single chapter url (base url by default) and return its content record"""
+        url = url or self.base_url
+        start = time.perf_counter()
+        extracted, path, validators, render_metrics = None, None, {}, None
 
-    async def scrape_content(self, state: WorkflowState) -> WorkflowState:
-        """Scrape content and take screenshots, content"""
-        async with async_playwright() as p:
-            # launch the browser with now browser window
-            # as we dont want to open browser window in case of dockerized cloudrun deployed run
-            browser = await p.chromium.launch(headless=True)
-            # opens the new page
-            page = await browser.new_page()
+        cached = self.cache.get(url, chapter_number) if self.cache else None
+        # within the ttl the saved record is served without touching the network
+        if cached and self.cache.fresh(cached[0]):
+            self.cache.stats["hits"] += 1
+            return self._cached_record(url, cached[1], "cache", start)
 
+        # fast path: static mediawiki pages do not need a browser
+        if self.config.HTTP_FIRST_FETCH:
             try:
-                # navigate to the url
-                await page.goto(self.base_url)
-                # wait for the page to load
-                # await lets it wait until the network idle state is reached. ro until fn executes
-                await page.wait_for_load_state("networkidle")
-
-                # take screenshot
-                # format the time string
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                # define path of the screenshot
-                screenshot_path = f"{self.screenshots_dir}/chapter_1_{timestamp}.png"
-                # take the screenshot and save in the defined path
-                await page.screenshot(path=screenshot_path, full_page=True)
-
-                # Extract content
-                # extract the content using oage content
-                content = await page.content()
-                # parse the html content using bs4
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # Find the main content area
-                main_content = soup.find('div', {'class': 'mw-parser-output'})
-                
-                if main_content:
-                    text_content = self.clean_text(main_content.get_text(separator='\n', strip=True))
-
-                    # save content
-                    content_data = {
-                        'url': self.base_url,
-                        'timestamp': timestamp,
-                        'title': 'The Gates of Morning - Book 1 - Chapter 1',
-                        'content': text_content,
-                        'screenshot_path': screenshot_path,
-                    }
-
-                    content_path = f"{self.content_dir}/chapter_1_{timestamp}.json"
-                    with open(content_path, 'w', encoding='utf-8') as file:
-                        json.dump(content_data, file, indent=2, ensure_ascii=False)
-
-                    return {
-                        **state,
-                        'original_content': content_data,
-                        'current_content': content_data,
-                        'status': 'scraped',
-                    }
-                
-            
+                extracted, path, validators = await self._fetch_http(url, cached[0] if cached else None)
+            except Exception as e:
+                print(f"HTTP fetch failed for {url}, falling back to browser: {e}")
+
+        if path == "revalidated":
+            self.cache.stats["revalidated"] += 1
+            self.cache.touch(url, validators)
+            return self._cached_record(url, cached[1], path, start)
+
+        if extracted is None:
+            try:
+                # the page comes from the process wide browser pool, so no browser launch per scrape
+                html, render_metrics = await self.browser_pool.run(partial(self._render_page, url=url))
+                extracted, path = self.extract_content(html), "playwright"
             except Exception as e:
                 print(f"Error scraping content: {e}")
                 return None
-            
-            finally:
-                # close the browser
-                await browser.close()
-        
+
+        if extracted is None:
+            self._log_fetch(url, path, start, render_metrics)
+            return None
+
+        page_title, text_content = extracted
+        content_hash = ScrapeStore.content_hash(text_content)
+
+        # fetched again but the text did not change, keep the existing record
+        if cached and cached[0].get('content_hash') == content_hash:
+            self.cache.stats["unchanged"] += 1
+            self.cache.touch(url, validators)
+            return self._cached_record(url, cached[1], f"{path}_unchanged", start, render_metrics)
+
+        if self.cache:
+            self.cache.stats["misses"] += 1
+        record = self._save_record(
+            url=url,
+            title=title or page_title or f"Chapter {chapter_number}",
+            chapter_number=chapter_number,
+            text_content=text_content,
+            content_hash=content_hash,
+            fetch_info=self._log_fetch(url, path, start, render_metrics),
+        )
+        if self.cache:
+            self.cache.put(url, chapter_number, content_hash, validators)
+        if self.screenshots:
+            self._schedule_screenshot(record)
+        return record
+
+    def _schedule_screenshot(self, record: Dict):
+        """Capture the page in the background and fill in screenshot_path of the record once written"""
+        def attach(paths: List[str]):
+            fields = {'screenshot_path': paths[0]}
+            if len(paths) > 1:
+                fields['screenshot_tiles'] = paths
+            record.update(fields)
+            self.store.update(record['url'], **fields)
+
+        name = f"chapter_{record['chapter_number']}_{record['timestamp']}"
+        self.screenshot_jobs[record['url']] = self.screenshots.schedule(record['url'], name, attach)
+
+    def wait_for_screenshots(self, timeout: Optional[float] = None) -> Dict[str, Optional[List[str]]]:
+        """Block until the pending screenshots are written, returns url -> image paths (None when failed)"""
+        results = {}
+        for url, job in self.screenshot_jobs.items():
+            try:
+                results[url] = job.result(timeout=timeout)
+            except Exception:
+                results[url] = None
+        self.screenshot_jobs.clear()
+        return results
+
+    def _log_fetch(self, url: str, path: Optional[str], start: float,
+                   render_metrics: Optional[Dict] = None) -> Dict:
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.fetch_log[url] = {'path': path, 'latency_ms': latency_ms}
+        if render_metrics:
+            self.fetch_log[url]['render'] = render_metrics
+        print(f"Scraped {url} via {path} in {latency_ms}ms")
+        return self.fetch_log[url]
+
+    def _cached_record(self, url: str, record: Dict, path: str, start: float,
+                       render_metrics: Optional[Dict] = None) -> Dict:
+        """Previously saved record, with the fetch info of this scrape"""
+        return {**record, 'fetch': self._log_fetch(url, path, start, render_metrics)}
+
+    def extract_content(self, html: str) -> Optional[Tuple[Optional[str], str]]:
+        """(title, cleaned text) of the mediawiki content area, None when the page has none"""
+        extracted = extract_paragraphs(html)
+        if extracted is None:
+            return None
+        title, paragraphs = extracted
+        # blank line between paragraphs so the paragraph structure survives in the stored text
+        return title, "\n\n".join(paragraphs)
+
+    async def _fetch_http(self, url: str, cached_entry: Optional[Dict] = None
+                          ) -> Tuple[Optional[Tuple[Optional[str], str]], Optional[str], Dict]:
+        """
+        Try the plain page and then the mediawiki parse endpoint, returns (extracted, path, validators).
+        With a cached entry the page request is conditional, a 304 comes back as the "revalidated" path.
+        """
+        response = await self.http.get(url, headers=ScrapeCache.conditional_headers(cached_entry))
+        if response.status_code == 304 and cached_entry:
+            return None, "revalidated", ScrapeCache.validators(response)
+
+        validators = ScrapeCache.validators(response) if response.status_code == 200 else {}
+        if response.status_code == 200:
+            extracted = self.extract_content(response.text)
+            if self._usable(extracted):
+                return extracted, "http", validators
+
+        api_url = self.http.parse_api_url(url)
+        if api_url:
+            response = await self.http.get(api_url)
+            if response.status_code == 200:
+                parsed = response.json().get("parse", {})
+                # wrap the parser output so the same extraction picks up the title
+                html = f'<h1 id="firstHeading">{parsed.get("displaytitle", "")}</h1>{parsed.get("text", "")}'
+                extracted = self.extract_content(html)
+                if self._usable(extracted):
+                    return extracted, "mediawiki_api", validators
+
+        return None, None, validators
+
+    def _usable(self, extracted: Optional[Tuple[Optional[str], str]]) -> bool:
+        return extracted is not None and len(extracted[1]) >= self.config.HTTP_MIN_CONTENT_CHARS
+
+    async def install_request_policy(self, page, url: str, metrics: Dict):
+        """
+        Abort images, media, fonts and scripts from other hosts on the page, and count
+        the requests, blocked requests and bytes transferred into metrics.
+        """
+        host = urlparse(url).netloc
+
+        async def route(route):
+            request = route.request
+            if request.resource_type in BLOCKED_RESOURCE_TYPES or (
+                    request.resource_type == "script" and urlparse(request.url).netloc != host):
+                metrics['blocked_requests'] += 1
+                await route.abort()
+            else:
+                await route.continue_()
+
+        async def finished(request):
+            try:
+                sizes = await request.sizes()
+            except Exception:
+                return
+            metrics['requests'] += 1
+            metrics['bytes_transferred'] += sizes['responseHeadersSize'] + sizes['responseBodySize']
+
+        metrics.update({'requests': 0, 'blocked_requests': 0, 'bytes_transferred': 0})
+        await page.route("**/*", route)
+        page.on("requestfinished", finished)
+
+    async def _render_page(self, page, url: str) -> Tuple[str, Dict]:
+        """Render the url with a pooled page, returns (html, render metrics)"""
+        metrics: Dict = {}
+        if self.config.SCRAPER_BLOCK_RESOURCES:
+            await self.install_request_policy(page, url, metrics)
+
+        # one hard deadline for navigation and readiness together
+        deadline = time.perf_counter() + self.config.SCRAPER_READY_TIMEOUT
+
+        # navigate to the url, the dom is enough as only the content container is read
+        wait_start = time.perf_counter()
+        await page.goto(url, wait_until="domcontentloaded", timeout=self.config.SCRAPER_READY_TIMEOUT * 1000)
+        metrics['goto_ms'] = round((time.perf_counter() - wait_start) * 1000, 1)
+
+        # wait for the content container instead of network idle
+        wait_start = time.perf_counter()
+        try:
+            await page.wait_for_selector(self.config.SCRAPER_READY_SELECTOR, state="attached",
+                                         timeout=max(deadline - time.perf_counter(), 0.001) * 1000)
+            metrics['ready'] = True
+        except PlaywrightTimeoutError:
+            # extract whatever is there, extract_content returns None if the container never showed up
+            metrics['ready'] = False
+        metrics['ready_wait_ms'] = round((time.perf_counter() - wait_start) * 1000, 1)
+
+        # Extract content
+        # only the heading and the content container leave the browser, not the whole serialized page
+        return await page.evaluate(CONTAINER_SCRIPT, self.config.SCRAPER_READY_SELECTOR), metrics
+
+    def _save_record(self, url: str, title: str, chapter_number: int, text_content: str,
+                     content_hash: str, fetch_info: Dict) -> Dict:
+        """Save the content record in the scrape store and return it"""
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        content_data = {
+            'url': url,
+            'timestamp': timestamp,
+            'title': title,
+            'chapter_number': chapter_number,
+            'content': text_content,
+            'content_hash': content_hash,
+            # filled in by the background screenshot, if any
+            'screenshot_path': None,
+            'fetch': fetch_info,
+        }
+        self.store.put(content_data)
+        return content_data
+
+    def pool_report(self) -> Dict:
+        """Time per scrape saved by the browser pool compared with a cold launch"""
+        return self.browser_pool.report()
+
 
 
 # async def main():
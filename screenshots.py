@@ -0,0 +1,96 @@
+# screenshots.py
+# background page screenshots, captured on the browser pool after the scraped text is already returned
+import asyncio
+import io
+import logging
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+# it is used to re-encode the png captures as jpeg / webp
+from PIL import Image
+from utils.config import Config
+from browser_pool import get_browser_pool
+
+logger = logging.getLogger(__name__)
+
+# pillow format name and file extension per configured screenshot format
+FORMATS = {
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+    "png": ("PNG", "png"),
+}
+
+
+class ScreenshotCapture:
+    """
+    Captures a page screenshot in the background on a pooled browser page.
+    mode "viewport" captures only the first screen, "full" the whole page as one image
+    and "tiled" the whole page as a series of fixed height images.
+    Playwright captures png, the re-encoding to jpeg / webp runs in a worker thread
+    so the pool loop keeps serving scrapes meanwhile.
+    """
+    def __init__(self, screenshots_dir: Optional[str] = None, image_format: Optional[str] = None,
+                 quality: Optional[int] = None, mode: Optional[str] = None):
+        self.config = Config()
+        self.screenshots_dir = screenshots_dir or self.config.SCREENSHOTS_PATH
+        self.image_format = (image_format or self.config.SCREENSHOT_FORMAT).lower()
+        self.quality = quality or self.config.SCREENSHOT_QUALITY
+        self.mode = (mode or self.config.SCREENSHOT_MODE).lower()
+        if self.image_format not in FORMATS:
+            raise ValueError(f"Unsupported screenshot format {self.image_format}, use one of {list(FORMATS)}")
+        if self.mode not in ("viewport", "full", "tiled"):
+            raise ValueError(f"Unsupported screenshot mode {self.mode}, use viewport, full or tiled")
+        self.pool = get_browser_pool()
+
+    def schedule(self, url: str, name: str, on_done: Callable[[List[str]], None]) -> Future:
+        """
+        Capture the url in the background, returns a concurrent.futures.Future of the image paths.
+        on_done(paths) is called once the images are written.
+        """
+        future = self.pool.submit_with_page(lambda page: self._capture(page, url, name))
+
+        def done(f: Future):
+            try:
+                paths = f.result()
+            except Exception as e:
+                logger.warning(f"Screenshot of {url} failed: {e}")
+                return
+            on_done(paths)
+
+        future.add_done_callback(done)
+        return future
+
+    async def _capture(self, page, url: str, name: str) -> List[str]:
+        await page.goto(url, wait_until="load")
+        pillow_format, extension = FORMATS[self.image_format]
+
+        if self.mode == "tiled":
+            width = page.viewport_size["width"] if page.viewport_size else 1280
+            height = await page.evaluate("document.documentElement.scrollHeight")
+            tile_height = self.config.SCREENSHOT_TILE_HEIGHT
+            captures = []
+            for index, top in enumerate(range(0, height, tile_height)):
+                if index >= self.config.SCREENSHOT_MAX_TILES:
+                    break
+                clip = {"x": 0, "y": top, "width": width, "height": min(tile_height, height - top)}
+                captures.append((f"{name}_tile{index + 1}", await page.screenshot(clip=clip, full_page=True)))
+        else:
+            captures = [(name, await page.screenshot(full_page=self.mode == "full"))]
+
+        loop = asyncio.get_running_loop()
+        paths = []
+        for stem, png in captures:
+            path = f"{self.screenshots_dir}/{stem}.{extension}"
+            await loop.run_in_executor(None, self._encode, png, path, pillow_format)
+            paths.append(path)
+        return paths
+
+    def _encode(self, png: bytes, path: str, pillow_format: str):
+        if pillow_format == "PNG":
+            with open(path, 'wb') as file:
+                file.write(png)
+            return
+        image = Image.open(io.BytesIO(png))
+        # jpeg has no alpha channel
+        if pillow_format == "JPEG":
+            image = image.convert("RGB")
+        image.save(path, format=pillow_format, quality=self.quality, optimize=True)
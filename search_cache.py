@@ -0,0 +1,114 @@
+# search_cache.py
+# in memory LRU + TTL cache of semantic search results, dropped whenever the collection changes,
+# and an in memory LRU of query vectors, which outlive writes
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SearchCache:
+    """
+    (query, n_results, filters) -> result list. Entries expire after ttl seconds, the least
+    recently used are evicted past max_entries, and invalidate() drops everything at once,
+    called after every write to the collection so a cached result never misses a new document.
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Dict]]]" = OrderedDict()
+        # bumped by invalidate(), a result computed before a write is not cached after it
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(query: str, n_results: int, where: Optional[Dict] = None) -> Hashable:
+        return query, n_results, json.dumps(where, sort_keys=True) if where else None
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: Hashable, results: List[Dict], generation: int):
+        """Cache a result computed while the cache was at generation"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.stats["invalidations"] += 1
+
+    def report(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+        }
+
+
+class QueryVectors:
+    """
+    Query string -> embedding, the max_entries most recently used kept in memory. Query vectors do
+    not depend on the stored documents, so unlike the results they survive writes; they never go to
+    the persistent document EmbeddingCache, whose rows are never evicted.
+    """
+    def __init__(self, max_entries: int, embed_fn: Callable[[List[str]], List]):
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def embed(self, queries: List[str]) -> List:
+        """Vectors of the queries in order, the ones not in memory embedded together in one call"""
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for query in queries:
+                if query in self._entries:
+                    self._entries.move_to_end(query)
+                    vectors[query] = self._entries[query]
+                    self.stats["hits"] += 1
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        if missing:
+            # embedded outside the lock, concurrent searches are not serialized on the model
+            fresh = dict(zip(missing, self.embed_fn(missing)))
+            vectors.update(fresh)
+            with self._lock:
+                self.stats["misses"] += len(missing)
+                for query, vector in fresh.items():
+                    self._entries[query] = vector
+                    self._entries.move_to_end(query)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return [vectors[query] for query in queries]
+
+    def report(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+        }
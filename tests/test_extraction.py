@@ -0,0 +1,23 @@
+# test_extraction.py
+# paragraph extraction must keep the words around <br> line breaks apart
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import extract_paragraphs
+
+
+def page(body: str) -> str:
+    return f'<h1 id="firstHeading">Book/Chapter 1</h1><div class="mw-parser-output">{body}</div>'
+
+
+def test_line_breaks_inside_a_paragraph_keep_words_apart():
+    title, paragraphs = extract_paragraphs(page("<p>Paragraph 0 text here<br>next line</p><p>The <i>sea</i>, again.</p>"))
+    assert title == "Book - Chapter 1"
+    assert paragraphs == ["Paragraph 0 text here next line", "The sea, again."]
+
+
+def test_line_breaks_without_paragraph_markup_split_lines():
+    title, paragraphs = extract_paragraphs(page("<div>First verse line<br/>second verse line</div>"))
+    assert paragraphs == ["First verse line", "second verse line"]
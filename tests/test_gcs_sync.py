@@ -0,0 +1,57 @@
+# test_gcs_sync.py
+# a restore must only mark the files the bucket holds as synced, local files it lacks are pushed next
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google_crc32c")
+
+from gcs_sync import LocalBucket, SnapshotSync
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def make_sync(tmp_path, compress=True) -> SnapshotSync:
+    return SnapshotSync(
+        LocalBucket(str(tmp_path / "bucket")), str(tmp_path / "chroma_db"), prefix="chroma_db/",
+        max_workers=2, compress=compress,
+    )
+
+
+def test_restore_from_empty_bucket_keeps_local_files_unsynced(tmp_path):
+    local_dir = tmp_path / "chroma_db"
+    write(str(local_dir / "chroma.sqlite3"), b"sqlite")
+    write(str(local_dir / "seg" / "header.bin"), b"hnsw header")
+
+    sync = make_sync(tmp_path)
+    assert sync.restore()["files"] == 0
+    assert sync.manifest == {}
+
+    write(str(local_dir / "chroma.sqlite3"), b"sqlite edited")
+    assert sync.push()["uploaded"] == 2
+    names = sorted(blob.name for blob in sync.bucket.list_blobs(prefix="chroma_db/"))
+    assert names == ["chroma_db/chroma.sqlite3.gz", "chroma_db/seg/header.bin.gz"]
+
+
+def test_restore_marks_only_downloaded_files(tmp_path):
+    source = tmp_path / "source"
+    write(str(source / "chroma.sqlite3"), b"sqlite")
+    SnapshotSync(LocalBucket(str(tmp_path / "bucket")), str(source), prefix="chroma_db/",
+                 manifest_path=str(tmp_path / "source.sync.json"), compress=True).push()
+
+    # a local file the bucket does not have, next to the snapshot
+    write(str(tmp_path / "chroma_db" / "seg" / "header.bin"), b"hnsw header")
+    sync = make_sync(tmp_path)
+    assert sync.restore()["files"] == 1
+    assert sorted(sync.manifest) == ["chroma.sqlite3"]
+
+    stats = sync.push()
+    assert stats["uploaded"] == 1 and stats["unchanged"] == 1
+    assert sync.bucket.blob("chroma_db/seg/header.bin.gz").exists()
@@ -0,0 +1,74 @@
+# test_llm_cache.py
+# rerunning the writer on the same chapter must hit the response cache, whatever changed in the scrape record
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("google.genai")
+writer_agent = pytest.importorskip("agents.writer_agent")
+
+from google.genai import types
+from llm_cache import response_key
+from llm_gateway import LLMGateway
+from utils.config import Config
+
+CHAPTER = "The sun was setting behind the hills.\n\nChildren ran across the fields."
+
+
+def scrape_record(timestamp: str, latency_ms: float) -> dict:
+    # what ContentScraper returns, fetch and timestamp differ on every scrape
+    return {
+        "url": "https://en.wikisource.org/wiki/The_Gates_of_Morning/Book_1/Chapter_1",
+        "timestamp": timestamp,
+        "title": "Chapter 1",
+        "chapter_number": 1,
+        "content": CHAPTER,
+        "content_hash": "abc",
+        "screenshot_path": None,
+        "fetch": {"path": "http", "latency_ms": latency_ms},
+    }
+
+
+def writer_state(record: dict) -> dict:
+    return {
+        "original_content": record, "current_content": record, "writer_output": "",
+        "reviewer_feedback": "NO FEEDBACK", "iteration_count": 0, "messages": [], "metadata": {},
+    }
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text="Rewritten.")]))]
+        )
+
+
+def test_rerun_of_the_same_chapter_hits_the_writer_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(Config, "LLM_CACHE_AGENTS", "writer")
+    gateway = LLMGateway()
+    models = FakeModels()
+    gateway.client = type("Client", (), {"aio": type("Aio", (), {"models": models})()})()
+
+    writer = writer_agent.WriterAgent.__new__(writer_agent.WriterAgent)
+    writer.config = Config()
+    writer.generation_config = types.GenerateContentConfig(temperature=0, max_output_tokens=100)
+
+    prompts = [
+        writer._prompt(writer_state(scrape_record("20250628044104", 812.4))),
+        writer._prompt(writer_state(scrape_record("20250628045056", 97.1))),
+    ]
+    assert CHAPTER in prompts[0] and "latency_ms" not in prompts[0]
+    assert response_key("m", [prompts[0]], writer.generation_config) == response_key("m", [prompts[1]], writer.generation_config)
+
+    for prompt in prompts:
+        gateway.generate_content("m", [prompt], writer.generation_config, agent="writer")
+    assert models.calls == 1
+    assert gateway.cache.report()["agents"]["writer"]["hits"] == 1
@@ -0,0 +1,76 @@
+# test_write_behind.py
+# a document chroma rejects must not hold back the documents queued after it
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_behind import WriteBehindQueue
+
+
+class FakeCollection:
+    """Stands in for collection.add, rejects the documents with doc_id "bad" like chroma rejects bad metadata"""
+    def __init__(self):
+        self.added = []
+        self.calls = 0
+
+    def add_batch(self, ids, documents, metadatas):
+        self.calls += 1
+        if "bad" in ids:
+            raise ValueError("Expected metadata value to be a str, int, float, bool, or None")
+        self.added.extend(ids)
+
+
+def make_queue(tmp_path, collection, dropped, **kwargs):
+    options = dict(batch_size=8, flush_interval=0.05, max_attempts=3, retry_base_seconds=0.05, retry_max_seconds=0.2)
+    options.update(kwargs)
+    return WriteBehindQueue(
+        str(tmp_path / "queue.sqlite3"), add_batch=collection.add_batch, on_dead_letter=dropped.extend, **options
+    )
+
+
+def test_bad_document_does_not_block_the_queue(tmp_path):
+    collection, dropped = FakeCollection(), []
+    queue = make_queue(tmp_path, collection, dropped)
+    queue.enqueue("bad", "rejected text", {"type": "writer_output"})
+    queue.enqueue("good", "accepted text", {"type": "writer_output"})
+
+    deadline = time.monotonic() + 5
+    while (queue.depth() or "bad" not in dropped) and time.monotonic() < deadline:
+        queue.flush(timeout=0.5)
+        time.sleep(0.05)
+
+    assert collection.added == ["good"]
+    assert queue.depth() == 0
+    assert dropped == ["bad"]
+    assert [entry["doc_id"] for entry in queue.dead_letters()] == ["bad"]
+    assert queue.flush(timeout=1)
+    queue.close()
+
+
+def test_failed_flush_returns_false_without_spinning(tmp_path):
+    collection, dropped = FakeCollection(), []
+    queue = make_queue(tmp_path, collection, dropped, max_attempts=100, retry_base_seconds=1, retry_max_seconds=1)
+    queue.enqueue("bad", "rejected text", {"type": "writer_output"})
+
+    start = time.monotonic()
+    assert queue.flush(timeout=5) is False
+    assert time.monotonic() - start < 1
+    calls = collection.calls
+    # backing off, an explicit flush does not retry right away
+    assert queue.flush(timeout=5) is False
+    assert collection.calls == calls
+    queue.close(timeout=0.5)
+
+
+def test_enqueue_rejects_metadata_chroma_cannot_store(tmp_path):
+    pytest.importorskip("chromadb")
+    collection, dropped = FakeCollection(), []
+    queue = make_queue(tmp_path, collection, dropped)
+    with pytest.raises(ValueError):
+        queue.enqueue("tags", "text", {"tags": ["a", "b"]})
+    assert queue.depth() == 0
+    queue.close()
@@ -23,6 +23,16 @@ class WorkflowState(TypedDict):
 	quality_report: str
 
 
+def chapter_text(content) -> str:
+	"""
+	Text of a state content field: the scraped record dict carries the chapter under 'content' next to
+	per scrape fields (timestamp, fetch latency), only the text may go into prompts and cache keys
+	"""
+	if isinstance(content, dict):
+		return content.get('content', '')
+	return content or ''
+
+
 load_dotenv()
 
 class Config:
@@ -50,4 +60,146 @@ class Config:
     # Workflow settings
 	MAX_ITERATIONS = 5
 	
-	CHROMA_DB_PATH = "./chroma_db"
\ No newline at end of file
+	CHROMA_DB_PATH = "./chroma_db"
+
+    # Scraper browser pool settings
+    # number of browser contexts kept alive and shared by all the scrapes of the process
+	BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+    # a context is closed and replaced after serving this many pages
+	BROWSER_POOL_MAX_PAGES_PER_CONTEXT = int(os.getenv("BROWSER_POOL_MAX_PAGES_PER_CONTEXT", "50"))
+
+    # Whole book crawl settings
+    # chapters scraped at the same time
+	CRAWL_MAX_WORKERS = int(os.getenv("CRAWL_MAX_WORKERS", "4"))
+    # politeness limits for a single host: requests in flight and seconds between request starts
+	CRAWL_PER_HOST_LIMIT = int(os.getenv("CRAWL_PER_HOST_LIMIT", "2"))
+	CRAWL_PER_HOST_DELAY = float(os.getenv("CRAWL_PER_HOST_DELAY", "0.5"))
+	CRAWL_MAX_CHAPTERS = int(os.getenv("CRAWL_MAX_CHAPTERS", "200"))
+
+    # HTTP first fetch settings
+    # try a plain http fetch of static pages before rendering them in chromium
+	HTTP_FIRST_FETCH = os.getenv("HTTP_FIRST_FETCH", "true").lower() == "true"
+	HTTP_FETCH_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "15"))
+	HTTP_USER_AGENT = os.getenv("HTTP_USER_AGENT", "ai-book-publisher/1.0 (content scraper)")
+    # below this many characters of cleaned text the fast path escalates to playwright
+	HTTP_MIN_CONTENT_CHARS = int(os.getenv("HTTP_MIN_CONTENT_CHARS", "200"))
+
+    # Scrape cache settings
+    # repeat scrapes of a url are served from the saved record (within the ttl) or revalidated with ETag / Last-Modified
+	SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "true").lower() == "true"
+	SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", "./content/scrape_cache.json")
+	SCRAPE_CACHE_TTL_SECONDS = float(os.getenv("SCRAPE_CACHE_TTL_SECONDS", "3600"))
+    # least recently used urls are evicted above this many entries
+	SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", "1000"))
+
+    # Screenshot settings
+    # screenshots are optional and captured in the background after the scraped text is returned
+	SCREENSHOT_ENABLED = os.getenv("SCREENSHOT_ENABLED", "false").lower() == "true"
+    # jpeg, webp or png
+	SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "jpeg")
+	SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "70"))
+    # viewport (first screen only), full (whole page as one image) or tiled (whole page in fixed height tiles)
+	SCREENSHOT_MODE = os.getenv("SCREENSHOT_MODE", "viewport")
+	SCREENSHOT_TILE_HEIGHT = int(os.getenv("SCREENSHOT_TILE_HEIGHT", "2000"))
+	SCREENSHOT_MAX_TILES = int(os.getenv("SCREENSHOT_MAX_TILES", "20"))
+
+    # Playwright render settings
+    # abort images, media, fonts and third party scripts while rendering a page for its text
+	SCRAPER_BLOCK_RESOURCES = os.getenv("SCRAPER_BLOCK_RESOURCES", "true").lower() == "true"
+    # a render is ready once this selector is attached, navigation and readiness share one deadline in seconds
+	SCRAPER_READY_SELECTOR = os.getenv("SCRAPER_READY_SELECTOR", "div.mw-parser-output")
+	SCRAPER_READY_TIMEOUT = float(os.getenv("SCRAPER_READY_TIMEOUT", "20"))
+
+    # Scrape store settings
+    # content addressed, gzip compressed chapter texts plus an append only manifest.jsonl index
+	SCRAPE_STORE_PATH = os.getenv("SCRAPE_STORE_PATH", "./content/store")
+
+    # GCS sync settings
+    # objects prefix of the chroma directory in the bucket and parallel transfers per sync
+	GCS_CHROMA_PREFIX = os.getenv("GCS_CHROMA_PREFIX", "chroma_db/")
+	GCS_SYNC_MAX_WORKERS = int(os.getenv("GCS_SYNC_MAX_WORKERS", "8"))
+    # store the snapshot files gzip compressed (<name>.gz), restore reads both forms
+	GCS_SYNC_COMPRESS = os.getenv("GCS_SYNC_COMPRESS", "true").lower() == "true"
+    # when set, a local directory stands in for the GCS bucket
+	GCS_LOCAL_BUCKET_PATH = os.getenv("GCS_LOCAL_BUCKET_PATH", "")
+
+    # Chroma write-behind settings
+    # store_content only queues the document, a background flusher adds queued documents in batches
+	CHROMA_WRITE_BEHIND = os.getenv("CHROMA_WRITE_BEHIND", "true").lower() == "true"
+	CHROMA_WRITE_BATCH_SIZE = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "32"))
+    # seconds between flusher wake ups when nothing new is queued
+	CHROMA_WRITE_FLUSH_INTERVAL = float(os.getenv("CHROMA_WRITE_FLUSH_INTERVAL", "2"))
+    # GCS snapshot sync runs once no write arrived for this many seconds
+	CHROMA_SYNC_DEBOUNCE = float(os.getenv("CHROMA_SYNC_DEBOUNCE", "10"))
+    # a queued document failing this many flushes is moved to the queue's dead_letter table,
+    # failed flushes are retried after CHROMA_WRITE_RETRY_SECONDS, doubling up to the max
+	CHROMA_WRITE_MAX_ATTEMPTS = int(os.getenv("CHROMA_WRITE_MAX_ATTEMPTS", "5"))
+	CHROMA_WRITE_RETRY_SECONDS = float(os.getenv("CHROMA_WRITE_RETRY_SECONDS", "1"))
+	CHROMA_WRITE_RETRY_MAX_SECONDS = float(os.getenv("CHROMA_WRITE_RETRY_MAX_SECONDS", "60"))
+
+    # Chroma startup settings
+    # connect GCS, restore the snapshot and open chroma in a background thread as soon as the manager is built,
+    # otherwise this happens on the first real use
+	CHROMA_WARMUP = os.getenv("CHROMA_WARMUP", "true").lower() == "true"
+
+    # Chroma embedding settings
+    # cache key of the embedding model, defaults to the name of the collection's embedding function
+	CHROMA_EMBEDDING_MODEL_ID = os.getenv("CHROMA_EMBEDDING_MODEL_ID", "")
+    # a version whose text matches a stored one of the same type and chapter is not stored again, store_content returns the existing doc_id
+	CHROMA_SKIP_DUPLICATES = os.getenv("CHROMA_SKIP_DUPLICATES", "true").lower() == "true"
+    # characters of each document kept in the listing index as its preview
+	CHROMA_PREVIEW_CHARS = int(os.getenv("CHROMA_PREVIEW_CHARS", "300"))
+
+    # Chroma search settings
+    # search results cached in memory per (query, n_results, filters), dropped on every write;
+    # the vectors of the last CHROMA_SEARCH_CACHE_SIZE queries are kept in memory as well, across writes
+	CHROMA_SEARCH_CACHE_SIZE = int(os.getenv("CHROMA_SEARCH_CACHE_SIZE", "256"))
+	CHROMA_SEARCH_CACHE_TTL = float(os.getenv("CHROMA_SEARCH_CACHE_TTL", "300"))
+    # also index every document as paragraph windows (own collection + sqlite FTS5 keyword index),
+    # search then returns the best matching passages ranked by fused vector and keyword scores
+	CHROMA_PASSAGE_INDEX = os.getenv("CHROMA_PASSAGE_INDEX", "false").lower() == "true"
+	CHROMA_PASSAGE_CHARS = int(os.getenv("CHROMA_PASSAGE_CHARS", "1000"))
+    # paragraphs repeated at the start of the next window
+	CHROMA_PASSAGE_OVERLAP = int(os.getenv("CHROMA_PASSAGE_OVERLAP", "1"))
+    # candidates taken from each side per requested result before the fusion
+	CHROMA_HYBRID_CANDIDATES = int(os.getenv("CHROMA_HYBRID_CANDIDATES", "4"))
+
+    # Chroma version storage settings
+    # store chapter version bodies as gzip line deltas against the previous version, outside chroma
+    # (embeddings and metadata stay in chroma), with a full keyframe every interval versions
+	CHROMA_DELTA_VERSIONS = os.getenv("CHROMA_DELTA_VERSIONS", "false").lower() == "true"
+	CHROMA_DELTA_KEYFRAME_INTERVAL = int(os.getenv("CHROMA_DELTA_KEYFRAME_INTERVAL", "10"))
+
+    # Embedding worker settings
+    # worker processes computing the embeddings (0 embeds in the calling thread), texts per worker call
+	CHROMA_EMBED_PROCESSES = int(os.getenv("CHROMA_EMBED_PROCESSES", "0"))
+	CHROMA_EMBED_BATCH_SIZE = int(os.getenv("CHROMA_EMBED_BATCH_SIZE", "32"))
+
+    # LLM gateway settings
+    # concurrent generate calls per model for the whole process, overrides as "model=limit,model=limit"
+	LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+	LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+    # keep-alive connections of the shared gemini client
+	LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "16"))
+
+    # LLM response cache settings
+    # responses kept in sqlite per (model, generation config, prompt hash), used by the agents listed here
+    # (the writer runs at temperature 0, the quality check repeats on unchanged content)
+	LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+	LLM_CACHE_AGENTS = os.getenv("LLM_CACHE_AGENTS", "writer,quality")
+	LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./content/llm_cache.sqlite3")
+	LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+    # least recently used responses are evicted above this many entries
+	LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    # call the model even for cached prompts and store the new responses
+	LLM_CACHE_REFRESH = os.getenv("LLM_CACHE_REFRESH", "false").lower() == "true"
+
+    # Writer chunked rewrite settings
+    # chapters longer than WRITER_CHUNK_CHARS are rewritten as paragraph aligned segments in parallel and stitched in order,
+    # each segment sees the paragraphs around it as read only context
+	WRITER_CHUNKED = os.getenv("WRITER_CHUNKED", "false").lower() == "true"
+	WRITER_CHUNK_CHARS = int(os.getenv("WRITER_CHUNK_CHARS", "6000"))
+	WRITER_CHUNK_CONTEXT_PARAGRAPHS = int(os.getenv("WRITER_CHUNK_CONTEXT_PARAGRAPHS", "2"))
+    # segments of a chapter rewritten at once (the gateway model limit still applies), extra attempts per failed segment
+	WRITER_CHUNK_CONCURRENCY = int(os.getenv("WRITER_CHUNK_CONCURRENCY", "4"))
+	WRITER_CHUNK_RETRIES = int(os.getenv("WRITER_CHUNK_RETRIES", "2"))
@@ -0,0 +1,226 @@
+# version_index.py
+# sqlite side tables indexing the stored documents and chapter versions, listings and history lookups never load document bodies
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+# metadata columns copied into the index, everything else stays in the metadata json
+COLUMNS = ("doc_id", "type", "iteration", "status", "timestamp", "content_hash")
+# sort keys accepted by list_documents, mapped to indexed columns
+SORT_COLUMNS = {"timestamp": "seq", "iteration": "iteration", "type": "type", "version_number": "version"}
+
+
+def chapter_ref(url: str) -> Dict[str, str]:
+    """
+    book, chapter and chapter_id of a chapter url, e.g. .../wiki/The_Gates_of_Morning/Book_1/Chapter_1
+    gives book "The_Gates_of_Morning/Book_1", chapter "Chapter_1"
+    """
+    path = unquote(urlparse(url).path).strip("/")
+    if path.startswith("wiki/"):
+        path = path[len("wiki/"):]
+    book, _, chapter = path.rpartition("/")
+    book = book or urlparse(url).netloc
+    return {"book": book, "chapter": chapter, "chapter_id": f"{book}/{chapter}"}
+
+
+class VersionIndex:
+    """
+    (chapter_id, version) -> doc_id and the listing metadata of every stored version.
+    Versions are numbered 1, 2, ... per chapter when recorded. The primary key and the
+    (chapter_id, iteration) index make latest, version k and a history page b-tree lookups,
+    whatever the number of versions of the chapter.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            "chapter_id TEXT NOT NULL, version INTEGER NOT NULL, book TEXT, doc_id TEXT NOT NULL, "
+            "type TEXT, iteration INTEGER, status TEXT, timestamp TEXT, content_hash TEXT, metadata TEXT NOT NULL, "
+            "PRIMARY KEY (chapter_id, version));"
+            "CREATE INDEX IF NOT EXISTS versions_iteration ON versions (chapter_id, iteration);"
+            "CREATE INDEX IF NOT EXISTS versions_book ON versions (book, chapter_id);"
+            "CREATE UNIQUE INDEX IF NOT EXISTS versions_doc ON versions (doc_id);"
+            # every stored document, in store order, with a short preview for listings
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL UNIQUE, type TEXT, iteration INTEGER, "
+            "chapter_id TEXT, version INTEGER, timestamp TEXT, preview TEXT, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_type ON documents (type, seq);"
+            "CREATE INDEX IF NOT EXISTS documents_iteration ON documents (iteration, seq);"
+            "CREATE INDEX IF NOT EXISTS documents_chapter ON documents (chapter_id, seq);"
+        )
+        self._db.commit()
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        return json.loads(row["metadata"])
+
+    # ---- writes ----
+    def record(self, chapter_id: str, metadata: Dict) -> int:
+        """Register a new version of the chapter and return its number"""
+        with self._lock:
+            # the max over a primary key prefix is a single b-tree seek
+            row = self._db.execute(
+                "SELECT MAX(version) FROM versions WHERE chapter_id = ?", (chapter_id,)
+            ).fetchone()
+            version = (row[0] or 0) + 1
+            self._insert(chapter_id, version, {**metadata, "chapter_id": chapter_id, "version_number": version})
+            self._db.commit()
+        return version
+
+    def _insert(self, chapter_id: str, version: int, metadata: Dict):
+        values = [metadata.get(column) for column in COLUMNS]
+        self._db.execute(
+            "INSERT OR REPLACE INTO versions (chapter_id, version, book, doc_id, type, iteration, status, "
+            "timestamp, content_hash, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (chapter_id, version, metadata.get("book"), *values, json.dumps(metadata)),
+        )
+
+    def add_document(self, metadata: Dict, content: str, preview_chars: int = 300):
+        """Index a stored document for listings"""
+        with self._lock:
+            self._insert_document(metadata, content, preview_chars)
+            self._db.commit()
+
+    def _insert_document(self, metadata: Dict, content: str, preview_chars: int):
+        self._db.execute(
+            "INSERT OR REPLACE INTO documents (doc_id, type, iteration, chapter_id, version, timestamp, preview, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (metadata["doc_id"], metadata.get("type"), metadata.get("iteration"), metadata.get("chapter_id"),
+             metadata.get("version_number"), metadata.get("timestamp"), (content or "")[:preview_chars],
+             json.dumps(metadata)),
+        )
+
+    def remove(self, doc_ids: List[str]) -> int:
+        """Drop documents (and their versions) that never made it into chroma, returns the rows removed"""
+        if not doc_ids:
+            return 0
+        marks = ",".join("?" * len(doc_ids))
+        with self._lock:
+            removed = self._db.execute(f"DELETE FROM versions WHERE doc_id IN ({marks})", doc_ids).rowcount
+            removed += self._db.execute(f"DELETE FROM documents WHERE doc_id IN ({marks})", doc_ids).rowcount
+            self._db.commit()
+        return removed
+
+    def rebuild_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+                          preview_chars: int = 300) -> int:
+        """Index documents already in chroma, oldest timestamp first so store order is kept"""
+        rows = sorted(zip(ids, documents, metadatas), key=lambda row: (row[2] or {}).get("timestamp", ""))
+        with self._lock:
+            for doc_id, content, metadata in rows:
+                self._insert_document({**(metadata or {}), "doc_id": doc_id}, content, preview_chars)
+            self._db.commit()
+        return len(rows)
+
+    def rebuild(self, metadatas: Iterable[Dict]) -> int:
+        """Fill the index from the metadata of the stored documents, e.g. after a restore on a new machine"""
+        count = 0
+        with self._lock:
+            for metadata in metadatas:
+                if metadata and metadata.get("chapter_id") and metadata.get("version_number"):
+                    self._insert(metadata["chapter_id"], int(metadata["version_number"]), metadata)
+                    count += 1
+            self._db.commit()
+        if count:
+            logger.info(f"Rebuilt the version index with {count} versions")
+        return count
+
+    # ---- lookups ----
+    def latest(self, chapter_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._db.execute(
+                "SELECT * FROM versions WHERE chapter_id = ? ORDER BY version DESC LIMIT 1", (chapter_id,)
+            ).fetchone())
+
+    def get(self, chapter_id: str, version: int) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._db.execute(
+                "SELECT * FROM versions WHERE chapter_id = ? AND version = ?", (chapter_id, version)
+            ).fetchone())
+
+    def by_iteration(self, chapter_id: str, iteration: int) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM versions WHERE chapter_id = ? AND iteration = ? ORDER BY version", (chapter_id, iteration)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def history(self, chapter_id: str, limit: int = 20, offset: int = 0, newest_first: bool = True,
+                after: Optional[int] = None) -> List[Dict]:
+        """
+        One page of the chapter's versions, metadata only. Pass the version_number of the last
+        row of the previous page as after, the page then starts with a seek instead of skipping offset rows.
+        """
+        order = "DESC" if newest_first else "ASC"
+        query, params = "SELECT * FROM versions WHERE chapter_id = ?", [chapter_id]
+        if after is not None:
+            query += " AND version < ?" if newest_first else " AND version > ?"
+            params.append(after)
+        with self._lock:
+            rows = self._db.execute(
+                f"{query} ORDER BY version {order} LIMIT ? OFFSET ?", (*params, limit, offset),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def count(self, chapter_id: Optional[str] = None) -> int:
+        with self._lock:
+            if chapter_id is None:
+                return self._db.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+            return self._db.execute(
+                "SELECT COUNT(*) FROM versions WHERE chapter_id = ?", (chapter_id,)
+            ).fetchone()[0]
+
+    def list_documents(self, limit: int = 20, offset: int = 0, doc_type: Optional[str] = None,
+                       iteration: Optional[int] = None, chapter_id: Optional[str] = None,
+                       sort: str = "timestamp", descending: bool = True) -> Dict:
+        """One page of documents, {"items": [{doc_id, metadata, preview}], "total": matching documents}"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort}, use one of {', '.join(SORT_COLUMNS)}")
+        conditions, params = [], []
+        for column, value in (("type", doc_type), ("iteration", iteration), ("chapter_id", chapter_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "DESC" if descending else "ASC"
+        # seq breaks ties, timestamps only have second resolution
+        order_by = f"{SORT_COLUMNS[sort]} {order}, seq {order}" if sort != "timestamp" else f"seq {order}"
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT doc_id, preview, metadata FROM documents{where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return {
+            "items": [{"doc_id": row["doc_id"], "metadata": json.loads(row["metadata"]), "preview": row["preview"]}
+                      for row in rows],
+            "total": total,
+        }
+
+    def document_types(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT type FROM documents WHERE type IS NOT NULL ORDER BY type").fetchall()
+        return [row[0] for row in rows]
+
+    def document_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def chapters(self, book: Optional[str] = None) -> List[Dict]:
+        """chapter_id, book and version count of every indexed chapter"""
+        query = "SELECT chapter_id, book, COUNT(*) AS versions FROM versions"
+        params = ()
+        if book is not None:
+            query += " WHERE book = ?"
+            params = (book,)
+        with self._lock:
+            rows = self._db.execute(f"{query} GROUP BY chapter_id ORDER BY chapter_id", params).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,290 @@
+# write_behind.py
+# write-behind persistence for ChromaManager: writes land in a durable local queue and are added to chroma in batches
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Durable queue of pending documents (a small sqlite file) drained by a background flusher.
+    Every flush_interval (or as soon as a full batch is waiting) the flusher groups pending documents
+    into add_batch(ids, documents, metadatas) calls of at most batch_size documents, and runs sync()
+    once no write arrived for sync_debounce seconds.
+    Pending rows survive a crash and are flushed on the next start.
+    When a batch fails its rows are retried one by one, so one document chroma rejects does not hold
+    back the others. A row failing max_attempts times is moved to the dead_letter table and reported to
+    on_dead_letter(doc_ids); after a failure the flusher backs off (doubling up to retry_max_seconds).
+    """
+    def __init__(self, path: str, add_batch: Callable[[List[str], List[str], List[Dict]], None],
+                 sync: Optional[Callable[[], None]] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, sync_debounce: Optional[float] = None,
+                 on_dead_letter: Optional[Callable[[List[str]], None]] = None,
+                 max_attempts: Optional[int] = None, retry_base_seconds: Optional[float] = None,
+                 retry_max_seconds: Optional[float] = None):
+        self.config = Config()
+        self.path = path
+        self.add_batch = add_batch
+        self.sync = sync
+        self.batch_size = batch_size or self.config.CHROMA_WRITE_BATCH_SIZE
+        self.flush_interval = self.config.CHROMA_WRITE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.sync_debounce = self.config.CHROMA_SYNC_DEBOUNCE if sync_debounce is None else sync_debounce
+        self.on_dead_letter = on_dead_letter
+        self.max_attempts = max_attempts or self.config.CHROMA_WRITE_MAX_ATTEMPTS
+        self.retry_base_seconds = self.config.CHROMA_WRITE_RETRY_SECONDS if retry_base_seconds is None else retry_base_seconds
+        self.retry_max_seconds = self.config.CHROMA_WRITE_RETRY_MAX_SECONDS if retry_max_seconds is None else retry_max_seconds
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, "
+            "document TEXT NOT NULL, metadata TEXT NOT NULL, queued_at REAL NOT NULL)"
+        )
+        # added after the first release, older queue files get the column here
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(pending)")]
+        if "attempts" not in columns:
+            self._db.execute("ALTER TABLE pending ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "seq INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL, "
+            "queued_at REAL NOT NULL, attempts INTEGER NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        self._wake = threading.Event()
+        self._idle = threading.Condition()
+        self._stopping = False
+        self._sync_due: Optional[float] = None
+        # consecutive failed drains and when the next attempt is allowed
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_drain_failed = False
+        self.stats = {
+            "queue_depth": self.depth(),
+            "flushes": 0,
+            "documents_flushed": 0,
+            "last_batch_size": 0,
+            "last_flush_seconds": None,
+            "max_queue_wait_seconds": 0.0,  # longest time a document waited in the queue
+            "syncs": 0,
+            "failed_flushes": 0,
+            "dead_letters": self.dead_letter_count(),
+            "last_error": None,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="chroma-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        if self.stats["queue_depth"]:
+            logger.info(f"Replaying {self.stats['queue_depth']} pending chroma writes from {path}")
+            self._wake.set()
+
+    # ---- producer side ----
+    def enqueue(self, doc_id: str, document: str, metadata: Dict):
+        """Persist the document in the queue and return at once, metadata chroma would reject raises ValueError"""
+        from chromadb.api.types import validate_metadata
+        validate_metadata(metadata)
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO pending (doc_id, document, metadata, queued_at) VALUES (?, ?, ?, ?)",
+                (doc_id, document, json.dumps(metadata), time.time()),
+            )
+            self._db.commit()
+        self.stats["queue_depth"] = self.depth()
+        # writes accumulate until the next flush interval, unless a full batch is already waiting
+        if self.stats["queue_depth"] >= self.batch_size:
+            self._wake.set()
+
+    def pending(self, doc_id: str) -> Optional[Dict]:
+        """A document still waiting in the queue, so reads see their own writes"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT document, metadata FROM pending WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'content': row[0], 'metadata': json.loads(row[1])}
+
+    def find_pending(self, content_hash: str, **fields) -> Optional[str]:
+        """doc_id of a queued document with this content hash and metadata fields, for duplicate suppression"""
+        query = "SELECT doc_id FROM pending WHERE json_extract(metadata, '$.content_hash') = ?"
+        params = [content_hash]
+        for key, value in fields.items():
+            query += f" AND json_extract(metadata, '$.{key}') = ?"
+            params.append(value)
+        with self._db_lock:
+            row = self._db.execute(f"{query} ORDER BY seq LIMIT 1", params).fetchone()
+        return row[0] if row else None
+
+    def depth(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def dead_letter_count(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        """Documents given up on, newest first, with the error of their last attempt"""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT doc_id, metadata, attempts, error, failed_at FROM dead_letter ORDER BY failed_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"doc_id": row[0], "metadata": json.loads(row[1]), "attempts": row[2], "error": row[3], "failed_at": row[4]}
+            for row in rows
+        ]
+
+    # ---- flusher ----
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        failed = False
+        if time.time() < self._retry_at:
+            # backing off after a failure, an explicit flush is told so instead of spinning
+            failed = True
+        else:
+            try:
+                while self._flush_batch():
+                    pass
+                if self._sync_due is not None and time.time() >= self._sync_due:
+                    self._run_sync()
+            except Exception as e:
+                failed = True
+                self._failures += 1
+                delay = min(self.retry_base_seconds * 2 ** (self._failures - 1), self.retry_max_seconds)
+                self._retry_at = time.time() + delay
+                self.stats["failed_flushes"] += 1
+                self.stats["last_error"] = str(e)
+                logger.error(f"Write-behind flush failed, retrying in {delay:.1f}s: {e}")
+            else:
+                self._failures = 0
+        self._last_drain_failed = failed
+        with self._idle:
+            self._idle.notify_all()
+
+    def _flush_batch(self) -> bool:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT seq, doc_id, document, metadata, queued_at, attempts FROM pending ORDER BY seq LIMIT ?",
+                (self.batch_size,),
+            ).fetchall()
+        if not rows:
+            return False
+
+        start = time.perf_counter()
+        try:
+            self.add_batch([row[1] for row in rows], [row[2] for row in rows], [json.loads(row[3]) for row in rows])
+        except Exception as e:
+            if len(rows) == 1:
+                self._failed_row(rows[0], e)
+                raise
+            # find the rows chroma rejects, the others go in on their own
+            logger.warning(f"Batch of {len(rows)} queued documents failed ({e}), adding them one by one")
+            error = None
+            for row in rows:
+                try:
+                    self.add_batch([row[1]], [row[2]], [json.loads(row[3])])
+                except Exception as row_error:
+                    error = row_error
+                    self._failed_row(row, row_error)
+                    continue
+                with self._db_lock:
+                    self._db.execute("DELETE FROM pending WHERE seq = ?", (row[0],))
+                    self._db.commit()
+            if error is not None:
+                raise error
+        else:
+            # only removed once chroma has them, a crash before this point replays the batch
+            with self._db_lock:
+                self._db.execute("DELETE FROM pending WHERE seq <= ?", (rows[-1][0],))
+                self._db.commit()
+
+        now = time.time()
+        self.stats["flushes"] += 1
+        self.stats["documents_flushed"] += len(rows)
+        self.stats["last_batch_size"] = len(rows)
+        self.stats["last_flush_seconds"] = round(time.perf_counter() - start, 4)
+        self.stats["max_queue_wait_seconds"] = max(self.stats["max_queue_wait_seconds"], now - rows[0][4])
+        self.stats["queue_depth"] = self.depth()
+        # debounce: every batch pushes the snapshot sync further out
+        if self.sync:
+            self._sync_due = now + self.sync_debounce
+        return True
+
+    def _failed_row(self, row, error: Exception):
+        """Count a failed attempt of a queued row, moving it to the dead letter table after max_attempts"""
+        seq, doc_id, attempts = row[0], row[1], row[5] + 1
+        with self._db_lock:
+            if attempts < self.max_attempts:
+                self._db.execute("UPDATE pending SET attempts = ? WHERE seq = ?", (attempts, seq))
+                self._db.commit()
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO dead_letter (seq, doc_id, document, metadata, queued_at, attempts, error, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (seq, doc_id, row[2], row[3], row[4], attempts, str(error), time.time()),
+            )
+            self._db.execute("DELETE FROM pending WHERE seq = ?", (seq,))
+            self._db.commit()
+        self.stats["dead_letters"] = self.dead_letter_count()
+        self.stats["queue_depth"] = self.depth()
+        logger.error(f"Giving up on queued document {doc_id} after {attempts} attempts: {error}")
+        if self.on_dead_letter:
+            try:
+                self.on_dead_letter([doc_id])
+            except Exception as e:
+                logger.error(f"Dead letter callback failed for {doc_id}: {e}")
+
+    def _run_sync(self):
+        self._sync_due = None
+        self.sync()
+        self.stats["syncs"] += 1
+
+    # ---- control ----
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every queued document is in chroma and the snapshot is synced, True on success.
+        False on timeout or as soon as a flush attempt fails (the flusher keeps retrying with backoff).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while True:
+                if self._sync_due is not None:
+                    # do not wait for the debounce on an explicit flush
+                    self._sync_due = time.time()
+                self._wake.set()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(timeout=remaining)
+                if self.depth() == 0 and self._sync_due is None:
+                    return True
+                if self._last_drain_failed:
+                    return False
+
+    def close(self, timeout: float = 30):
+        """Drain the queue on shutdown and stop the flusher"""
+        if self._stopping:
+            return
+        if not self.flush(timeout=timeout):
+            logger.warning(f"{self.depth()} chroma writes still queued at shutdown, they are replayed on next start")
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    def report(self) -> Dict:
+        return {**self.stats, "queue_depth": self.depth(), "dead_letters": self.dead_letter_count()}